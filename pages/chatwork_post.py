@@ -6,20 +6,35 @@ resultページからChatWork処理を分離し、パフォーマンスを改善
 """
 import streamlit as st
 from utils.common import format_vote_data_with_thresh
-from utils.db import get_connection
+from utils.db import get_vote_summary
 from utils import chatwork
 from io import BytesIO
+from functools import lru_cache
 import platform
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
+# 画像生成ライブラリはモジュール読み込み時に1回だけimportする（リクエスト毎のimportを避ける）
+try:
+    from wordcloud import WordCloud
+    from PIL import Image, ImageDraw, ImageFont
+    _HAS_IMAGE_LIBS = True
+except ImportError:
+    _HAS_IMAGE_LIBS = False
 
+# アプリ同梱フォントのパス（モジュール読み込み時に1回だけ計算）
+APP_FONT_PATH = os.path.join(os.path.dirname(__file__), "..", "fonts", "NotoSansJP-Regular.otf")
+
+
+@lru_cache(maxsize=1)
 def get_font_path():
     """
     環境に応じて日本語フォントのパスを返す関数
+    実行中にフォント配置は変わらないため、結果をプロセス内でキャッシュする
     """
-    app_font_path = os.path.join(os.path.dirname(__file__), "..", "fonts", "NotoSansJP-Regular.otf")
-    if os.path.exists(app_font_path):
-        return app_font_path
+    if os.path.exists(APP_FONT_PATH):
+        return APP_FONT_PATH
     
     system = platform.system()
     if system == "Windows":
@@ -45,123 +60,163 @@ def get_font_path():
     return None
 
 
-def _get_vote_data(selected_date_str):
-    """対象日の投票結果データと投票セッション数を取得"""
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # 投票ボタンが押された回数
-    c.execute(
-        "SELECT COUNT(DISTINCT created_at) as vote_sessions FROM vote WHERE vote_date = ?",
-        (selected_date_str,)
+# 投稿用PNGのzlib圧縮レベル（デフォルト6より低くしてエンコードCPUを削減）
+PNG_COMPRESS_LEVEL = 1
+
+# ワードクラウドに配置する最大銘柄数
+WORDCLOUD_MAX_WORDS = 100
+
+# 画像（ワードクラウド・ランキング）を生成する最小銘柄数
+MIN_RESULTS_FOR_IMAGES = 3
+
+# ランキング画像のレイアウト（px）
+RANKING_IMAGE_WIDTH = 1000
+RANKING_COL_WIDTHS = [0.1, 0.15, 0.4, 0.15, 0.15]
+RANKING_ROW_HEIGHT = 36
+RANKING_TITLE_HEIGHT = 80
+RANKING_MARGIN = 20
+
+
+# WordCloudインスタンスはセッション間で共有するため、生成～画像化を排他制御する
+_WORDCLOUD_LOCK = threading.Lock()
+
+
+@st.cache_resource
+def _get_wordcloud(font_path):
+    """ワードクラウド生成器（フォント設定済み）を1回だけ構築して再利用する"""
+    return WordCloud(
+        width=800, height=400,
+        background_color='white',
+        font_path=font_path
+    )
+
+
+@st.cache_resource
+def _get_ranking_fonts(font_path):
+    """ランキング画像用のフォント（タイトル, セル）を1回だけ読み込んで再利用する"""
+    if font_path:
+        return ImageFont.truetype(font_path, 28), ImageFont.truetype(font_path, 18)
+    return ImageFont.load_default(size=28), ImageFont.load_default(size=18)
+
+
+def _draw_ranking_image(title, columns, table_data, fonts):
+    """
+    ランキング表をPillowで直接描画する
+    matplotlibのTable描画・tight bbox計算を経由しないため高速
+    """
+    title_font, cell_font = fonts
+
+    table_width = RANKING_IMAGE_WIDTH - RANKING_MARGIN * 2
+    col_x = [RANKING_MARGIN]
+    for ratio in RANKING_COL_WIDTHS:
+        col_x.append(col_x[-1] + int(table_width * ratio / sum(RANKING_COL_WIDTHS)))
+    table_top = RANKING_TITLE_HEIGHT
+    height = table_top + RANKING_ROW_HEIGHT * (len(table_data) + 1) + RANKING_MARGIN
+
+    img = Image.new("RGB", (RANKING_IMAGE_WIDTH, height), "white")
+    draw = ImageDraw.Draw(img)
+    draw.text((RANKING_IMAGE_WIDTH / 2, RANKING_TITLE_HEIGHT / 2), title, font=title_font, fill="black", anchor="mm")
+
+    # ヘッダー行の背景
+    draw.rectangle(
+        [col_x[0], table_top, col_x[-1], table_top + RANKING_ROW_HEIGHT],
+        fill="#f0f0f0"
     )
-    vote_sessions_result = c.fetchone()
-    vote_sessions = vote_sessions_result[0] if vote_sessions_result is not None else 0
-    
-    # 各銘柄の投票数を集計
-    c.execute(
-        """
-        SELECT v.stock_code, COUNT(*) as vote_count, m.stock_name
-        FROM vote v
-        LEFT JOIN stock_master m ON v.stock_code = m.stock_code
-        WHERE v.vote_date = ?
-        GROUP BY v.stock_code
-        ORDER BY vote_count DESC
-        """,
-        (selected_date_str,)
+    for row_idx, row in enumerate([columns] + table_data):
+        y = table_top + row_idx * RANKING_ROW_HEIGHT
+        for col_idx, text in enumerate(row):
+            x0, x1 = col_x[col_idx], col_x[col_idx + 1]
+            draw.rectangle([x0, y, x1, y + RANKING_ROW_HEIGHT], outline="black")
+            draw.text(
+                ((x0 + x1) / 2, y + RANKING_ROW_HEIGHT / 2), text,
+                font=cell_font, fill="black", anchor="mm",
+                # ヘッダーは縁取りで太字風にする
+                stroke_width=1 if row_idx == 0 else 0, stroke_fill="black"
+            )
+    return img
+
+
+def _build_wordcloud_png(wc, vote_dict):
+    """ワードクラウドのPNGバイト列を生成"""
+    with _WORDCLOUD_LOCK:
+        # WordCloudは既にラスタ画像なので、matplotlibを経由せずPILで直接PNG化する
+        wc_image = wc.generate_from_frequencies(vote_dict).to_image()
+    buf = BytesIO()
+    wc_image.save(buf, format="PNG", optimize=False, compress_level=PNG_COMPRESS_LEVEL)
+    return buf.getvalue()
+
+
+def _build_ranking_png(title, columns, table_data, fonts):
+    """ランキング画像のPNGバイト列を生成"""
+    buf = BytesIO()
+    _draw_ranking_image(title, columns, table_data, fonts).save(
+        buf, format="PNG", compress_level=PNG_COMPRESS_LEVEL
     )
-    results = c.fetchall()
-    conn.close()
-    
-    return results, vote_sessions
+    return buf.getvalue()
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _encode_vote_text(results):
+    """票数付テキスト（区切り入り）をUTF-8バイト列で生成（同じ投票結果なら再利用）"""
+    return format_vote_data_with_thresh(results).encode("utf-8")
 
 
-def _generate_files(results, vote_sessions, selected_date, selected_date_str):
-    """投稿用ファイル（テキスト、ワードクラウド、ランキング）を生成"""
+@st.cache_data(ttl=300, show_spinner=False)  # 画像生成は重いため同じ投票結果なら再利用
+def _generate_files(results, vote_sessions, date_str, selected_date_str):
+    """
+    投稿用ファイル（テキスト、ワードクラウド、ランキング）を生成
+    
+    Parameters:
+    date_str (str): ファイル名用の日付（YYYYMMDD、呼び出し元で1回だけ生成）
+    
+    Returns:
+    list: [(ファイル名, データ, MIMEタイプ, サイズKB), ...]
+    """
     files_to_post = []
     
     # 1. テキストファイル（票数付）
-    sorted_results_with_thresh = format_vote_data_with_thresh(results)
-    if sorted_results_with_thresh:
-        filename = f"投票結果{selected_date.strftime('%Y%m%d')}_票数付.txt"
-        files_to_post.append((filename, sorted_results_with_thresh.encode("utf-8"), "text/plain"))
+    text_bytes = _encode_vote_text(tuple(results))
+    if text_bytes:
+        filename = f"投票結果{date_str}_票数付.txt"
+        files_to_post.append((filename, text_bytes, "text/plain", len(text_bytes) / 1024))
     
     # 2. ワードクラウド画像 & 3. ランキング画像
-    try:
-        from wordcloud import WordCloud
-        import matplotlib
-        matplotlib.use('Agg')
-        import matplotlib.pyplot as plt
-        
-        font_path = get_font_path()
-        
-        # ワードクラウド
-        vote_dict = {row[0]: row[1] for row in results}
-        wc = WordCloud(
-            width=800, height=400,
-            background_color='white',
-            font_path=font_path
-        ).generate_from_frequencies(vote_dict)
-        
-        fig_wc = plt.figure(figsize=(10, 5))
-        plt.imshow(wc, interpolation='bilinear')
-        plt.axis("off")
-        
-        buf_wc = BytesIO()
-        fig_wc.savefig(buf_wc, format="png", bbox_inches='tight', pad_inches=0.1)
-        plt.close(fig_wc)
-        wordcloud_filename = f"銘柄投票{selected_date.strftime('%Y%m%d')}.png"
-        files_to_post.append((wordcloud_filename, buf_wc.getvalue(), "image/png"))
-        
-        # ランキング画像
-        font_prop = None
-        if font_path:
-            from matplotlib import font_manager
-            font_prop = font_manager.FontProperties(fname=font_path)
-        
-        top_20 = results[:20]
-        columns = ["順位", "銘柄コード", "銘柄名", "投票数", "割合"]
-        table_data = []
-        for i, row in enumerate(top_20, 1):
-            stock_code = row[0]
-            vote_count = row[1]
-            stock_name = row[2] or stock_code
-            percentage = (vote_count / vote_sessions * 100) if vote_sessions > 0 else 0
-            table_data.append([str(i), stock_code, stock_name, str(vote_count), f"{percentage:.1f}%"])
-        
-        fig_table = plt.figure(figsize=(10, len(top_20) * 0.5 + 2))
-        ax = fig_table.add_subplot(111)
-        ax.axis('off')
-        ax.set_title(
-            f"銘柄投票ランキング ({selected_date_str})",
-            fontproperties=font_prop if font_path else None,
-            fontsize=16, pad=20
-        )
-        table = ax.table(
-            cellText=table_data, colLabels=columns,
-            loc='center', cellLoc='center',
-            colWidths=[0.1, 0.15, 0.4, 0.15, 0.15]
+    if not _HAS_IMAGE_LIBS:
+        st.warning("wordcloud/Pillowが未インストールのため、画像ファイルは生成されません。")
+        return files_to_post
+
+    # 件数が少ない場合はワードクラウド・ランキングを作る意味がないため画像生成を省略
+    if vote_sessions == 0 or len(results) < MIN_RESULTS_FOR_IMAGES:
+        return files_to_post
+
+    font_path = get_font_path()
+    # resultsは投票数の降順なので、表示されない下位銘柄を除いた上位のみをレイアウト対象にする
+    # (銘柄コード, 投票数) の2要素タプルから直接構築
+    vote_dict = dict(row[:2] for row in results[:WORDCLOUD_MAX_WORDS])
+    
+    # ランキング表データ
+    columns = ["順位", "銘柄コード", "銘柄名", "投票数", "割合"]
+    # 割合計算用の係数を先に求めておく（投票セッション0件なら0%）
+    pct_factor = (100.0 / vote_sessions) if vote_sessions > 0 else 0.0
+    table_data = [
+        [str(i), row[0], row[2] or row[0], str(row[1]), f"{row[1] * pct_factor:.1f}%"]
+        for i, row in enumerate(results[:20], 1)
+    ]
+    
+    # キャッシュ済みリソースはメインスレッドで取得し、2つの画像は並列に生成する
+    wc = _get_wordcloud(font_path)
+    fonts = _get_ranking_fonts(font_path)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        fut_wc = executor.submit(_build_wordcloud_png, wc, vote_dict)
+        fut_rank = executor.submit(
+            _build_ranking_png, f"銘柄投票ランキング ({selected_date_str})", columns, table_data, fonts
         )
-        table.auto_set_font_size(False)
-        table.set_fontsize(12)
-        table.scale(1, 1.5)
-        
-        if font_path:
-            for cell in table.get_celld().values():
-                cell.set_text_props(fontproperties=font_prop)
-            for (row, col), cell in table.get_celld().items():
-                if row == 0:
-                    cell.set_text_props(weight='bold', fontproperties=font_prop)
-                    cell.set_facecolor('#f0f0f0')
-        
-        buf_rank = BytesIO()
-        fig_table.savefig(buf_rank, format="png", bbox_inches='tight', pad_inches=0.1)
-        plt.close(fig_table)
-        ranking_filename = f"銘柄投票ランキング{selected_date.strftime('%Y%m%d')}.png"
-        files_to_post.append((ranking_filename, buf_rank.getvalue(), "image/png"))
-        
-    except ImportError:
-        st.warning("wordcloud/matplotlibが未インストールのため、画像ファイルは生成されません。")
+        wordcloud_filename = f"銘柄投票{date_str}.png"
+        wc_png = fut_wc.result()
+        files_to_post.append((wordcloud_filename, wc_png, "image/png", len(wc_png) / 1024))
+        ranking_filename = f"銘柄投票ランキング{date_str}.png"
+        rank_png = fut_rank.result()
+        files_to_post.append((ranking_filename, rank_png, "image/png", len(rank_png) / 1024))
     
     return files_to_post
 
@@ -174,7 +229,7 @@ def show(selected_date):
     st.write(f"【対象日】{selected_date_str}")
     
     # 投票結果データ取得
-    results, vote_sessions = _get_vote_data(selected_date_str)
+    results, _, vote_sessions = get_vote_summary(selected_date_str)
     
     if not results:
         st.warning("対象日の投票結果がありません。投票結果がある日付を選択してください。")
@@ -186,13 +241,12 @@ def show(selected_date):
     
     # 投稿ファイルの生成
     with st.spinner("投稿ファイルを生成中..."):
-        files_to_post = _generate_files(results, vote_sessions, selected_date, selected_date_str)
+        files_to_post = _generate_files(results, vote_sessions, date_str, selected_date_str)
     
     # ファイルプレビュー
     st.subheader("投稿予定ファイル")
     if files_to_post:
-        for fname, data, mime in files_to_post:
-            size_kb = len(data) / 1024
+        for fname, data, mime, size_kb in files_to_post:
             st.write(f"📄 **{fname}** ({size_kb:.1f} KB)")
     else:
         st.warning("投稿するファイルがありません。")
@@ -208,12 +262,11 @@ def show(selected_date):
         chatwork.show_login_button(return_page="chatwork_post", return_date=date_str)
     else:
         try:
-            if not chatwork.is_room_member():
+            is_member, profile = chatwork.get_member_status()
+            if not is_member:
                 st.warning("このルームのメンバーではないため、投稿できません。先にChatWorkでルームに参加してください。")
                 chatwork.show_logout_button()
             else:
-                # ログインユーザー情報を取得
-                profile = chatwork.get_my_profile()
                 user_name = profile.get("name", "不明") if profile else "不明"
                 
                 col_status, col_logout = st.columns([3, 1])
@@ -226,7 +279,9 @@ def show(selected_date):
                 if st.button("ChatWorkに投稿", type="primary"):
                     try:
                         message = f"投票結果 ({selected_date_str})"
-                        chatwork.post_files_to_room(files_to_post, message)
+                        chatwork.post_files_to_room_concurrent(
+                            [f[:3] for f in files_to_post], message, max_workers=3
+                        )
                         st.success("ChatWorkに投稿しました！ 🎉")
                     except Exception as e:
                         st.error(f"投稿エラー: {e}")
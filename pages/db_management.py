@@ -5,6 +5,7 @@ from datetime import datetime
 from io import BytesIO
 import pandas as pd
 from utils.db import get_connection
+from utils.common import clear_stock_name_cache
 
 def show(selected_date):
     st.title("データベース管理")
@@ -119,6 +120,8 @@ def show_import():
 
                         # コミット
                         conn.commit()
+                        # 銘柄マスタが入れ替わるため、キャッシュ済みの銘柄名を破棄する
+                        clear_stock_name_cache()
                         st.success("データのインポートが完了しました。")
 
                     except Exception as e:
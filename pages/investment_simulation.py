@@ -7,9 +7,12 @@ import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import calendar
-from utils.db import get_connection, init_price_cache_table
-from utils.common import get_stock_name, get_ticker
-from functools import lru_cache
+import io
+import uuid
+from utils.db import shared_connection, init_price_cache_table
+from utils.common import get_stock_name, get_stock_names, get_ticker, is_jpy_stock_code
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 # デフォルトの投資配分比率
 DEFAULT_ALLOCATION = [25, 20, 15, 10, 5, 5, 5, 5, 5, 5]
@@ -20,6 +23,19 @@ TRADING_COSTS = {
     'slippage_rate': 0.0005,   # 0.05%のスリッページ
     'spread_rate': 0.0002       # 0.02%のスプレッド
 }
+# 取引額に対する取引コストの合計率（取引コスト = 取引額 × TOTAL_COST_RATE）
+TOTAL_COST_RATE = sum(TRADING_COSTS.values())
+
+# 株価の並列取得に使うスレッド数（キャッシュにない銘柄はyfinanceへのHTTP待ちになる）
+PRICE_FETCH_WORKERS = 16
+
+# 期間中の株価を一括取得する際の1リクエストあたりの銘柄数
+PREFETCH_CHUNK_SIZE = 50
+
+# シミュレーション中の進捗表示を更新する間隔（日数）。毎日更新するとブラウザへの送信が多くなる
+PROGRESS_UPDATE_INTERVAL_DAYS = 10
+# 長期間のシミュレーションでも進捗表示の更新はこの回数程度に抑える
+MAX_PROGRESS_UPDATES = 100
 
 # リスクフリーレート（シャープレシオ計算用）
 # 日本の10年国債利回りを想定。市場環境に応じて調整が必要
@@ -36,16 +52,15 @@ def get_price_from_cache(stock_code, date_str):
     戻り値:
         float: 株価、または該当データがない場合は None
     """
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute("""
-            SELECT price FROM price_cache
-            WHERE stock_code = ? AND date = ?
-        """, (stock_code, date_str))
+        with shared_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT price FROM price_cache
+                WHERE stock_code = ? AND date = ?
+            """, (stock_code, date_str))
 
-        result = cursor.fetchone()
+            result = cursor.fetchone()
 
         if result:
             return float(result[0])
@@ -53,9 +68,60 @@ def get_price_from_cache(stock_code, date_str):
 
     except Exception as e:
         return None
-    finally:
-        if conn is not None:
-            conn.close()
+
+def get_prices_from_cache_bulk(stock_codes, date_str):
+    """
+    キャッシュから複数銘柄の株価を1回のクエリでまとめて取得
+
+    引数:
+        stock_codes (list): 銘柄コードのリスト
+        date_str (str): 日付（例: 'YYYY-MM-DD' 形式）
+
+    戻り値:
+        dict: {銘柄コード: 株価}（キャッシュにない銘柄は含まない）
+    """
+    stock_codes = list(dict.fromkeys(stock_codes))
+    if not stock_codes:
+        return {}
+
+    try:
+        placeholders = ",".join("?" * len(stock_codes))
+        with shared_connection() as conn:
+            cursor = conn.execute(f"""
+                SELECT stock_code, price FROM price_cache
+                WHERE date = ? AND stock_code IN ({placeholders})
+            """, (date_str, *stock_codes))
+            rows = cursor.fetchall()
+
+        return {stock_code: float(price) for stock_code, price in rows}
+
+    except Exception as e:
+        return {}
+
+def get_prices_from_cache_for_period(stock_code, start_date_str, end_date_str):
+    """
+    キャッシュから1銘柄の期間中の株価をまとめて取得
+
+    引数:
+        stock_code (str): 銘柄コード（為替の場合は'USDJPY=X'）
+        start_date_str (str): 開始日（'YYYY-MM-DD' 形式）
+        end_date_str (str): 終了日（'YYYY-MM-DD' 形式）
+
+    戻り値:
+        dict: {日付: 株価}（キャッシュにない日付は含まない）
+    """
+    try:
+        with shared_connection() as conn:
+            cursor = conn.execute("""
+                SELECT date, price FROM price_cache
+                WHERE stock_code = ? AND date BETWEEN ? AND ?
+            """, (stock_code, start_date_str, end_date_str))
+            rows = cursor.fetchall()
+
+        return {date_str: float(price) for date_str, price in rows}
+
+    except Exception as e:
+        return {}
 
 def save_price_to_cache(stock_code, date_str, price, currency):
     """
@@ -67,29 +133,141 @@ def save_price_to_cache(stock_code, date_str, price, currency):
     price (float): 株価
     currency (str): 通貨（'JPY', 'USD', 'FX'）
     """
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-
         updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-        # INSERT OR REPLACE を使用して更新
-        cursor.execute("""
-            INSERT OR REPLACE INTO price_cache
-            (stock_code, date, price, currency, updated_at)
-            VALUES (?, ?, ?, ?, ?)
-        """, (stock_code, date_str, price, currency, updated_at))
+        with shared_connection() as conn:
+            # INSERT OR REPLACE を使用して更新
+            conn.execute("""
+                INSERT OR REPLACE INTO price_cache
+                (stock_code, date, price, currency, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, (stock_code, date_str, price, currency, updated_at))
 
-        conn.commit()
+            conn.commit()
 
     except Exception as e:
         st.error(f"Failed to save price to cache for {stock_code} on {date_str}: {e}")
-    finally:
-        if conn is not None:
-            conn.close()
 
-@lru_cache(maxsize=1000)
+def save_prices_to_cache_bulk(rows):
+    """
+    複数の株価を1回のトランザクションでまとめてキャッシュに保存
+
+    Parameters:
+    rows (list): (銘柄コード, 日付, 株価, 通貨, 更新日時) のタプルのリスト
+    """
+    if not rows:
+        return
+
+    try:
+        with shared_connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO price_cache
+                (stock_code, date, price, currency, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, rows)
+            conn.commit()
+
+    except Exception as e:
+        st.error(f"Failed to save {len(rows)} prices to cache: {e}")
+
+# 株価が取得できなかった記録の有効期間（時間）
+PRICE_MISS_TTL_HOURS = 24
+
+def is_recent_price_miss(stock_code, date_str):
+    """
+    指定の銘柄・日付が直近で取得失敗として記録されているか確認
+
+    Returns:
+        bool: PRICE_MISS_TTL_HOURS 以内に取得できなかった記録があれば True
+    """
+    try:
+        threshold = (datetime.now() - timedelta(hours=PRICE_MISS_TTL_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+        with shared_connection() as conn:
+            cursor = conn.execute("""
+                SELECT 1 FROM price_cache_miss
+                WHERE stock_code = ? AND date = ? AND checked_at >= ?
+            """, (stock_code, date_str, threshold))
+            return cursor.fetchone() is not None
+    except Exception:
+        return False
+
+def get_recent_price_misses(stock_codes, date_str):
+    """
+    指定日について直近で取得失敗として記録されている銘柄をまとめて取得
+
+    Returns:
+        set: PRICE_MISS_TTL_HOURS 以内に取得できなかった記録がある銘柄コード
+    """
+    stock_codes = list(dict.fromkeys(stock_codes))
+    if not stock_codes:
+        return set()
+
+    try:
+        threshold = (datetime.now() - timedelta(hours=PRICE_MISS_TTL_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+        placeholders = ",".join("?" * len(stock_codes))
+        with shared_connection() as conn:
+            cursor = conn.execute(f"""
+                SELECT stock_code FROM price_cache_miss
+                WHERE date = ? AND checked_at >= ? AND stock_code IN ({placeholders})
+            """, (date_str, threshold, *stock_codes))
+            return {row[0] for row in cursor.fetchall()}
+    except Exception:
+        return set()
+
+def save_price_miss(stock_code, date_str):
+    """yfinanceからも株価が取得できなかったことを記録"""
+    try:
+        checked_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with shared_connection() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO price_cache_miss
+                (stock_code, date, checked_at)
+                VALUES (?, ?, ?)
+            """, (stock_code, date_str, checked_at))
+            conn.commit()
+    except Exception:
+        pass
+
+def save_price_misses_bulk(stock_codes, date_str):
+    """yfinanceからも株価が取得できなかった複数銘柄を1回のトランザクションで記録"""
+    if not stock_codes:
+        return
+
+    try:
+        checked_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        with shared_connection() as conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO price_cache_miss
+                (stock_code, date, checked_at)
+                VALUES (?, ?, ?)
+            """, [(stock_code, date_str, checked_at) for stock_code in stock_codes])
+            conn.commit()
+    except Exception:
+        pass
+
+def _close_asof(df, target_date):
+    """
+    yf.downloadの結果から指定日以前で最新の終値を取得
+
+    Returns:
+        float: 終値、指定日以前のデータがない場合は None
+    """
+    close = df["Close"]
+    # 新しいyfinanceでは単一銘柄でも (項目, ticker) の列になるため1列目を使う
+    if isinstance(close, pd.DataFrame):
+        close = close.iloc[:, 0]
+    close_value = close.asof(pd.Timestamp(target_date))
+    return float(close_value) if pd.notna(close_value) else None
+
+def is_price_miss_recordable(target_date):
+    """
+    指定日について取得失敗を記録してよいか（今日より前の日付のみ）
+
+    当日以降はまだ終値が出ていないだけの可能性があるため、取得失敗として記録しない。
+    """
+    return target_date < date.today().strftime("%Y-%m-%d")
+
 def get_exchange_rate(target_date):
     """
     指定日のUSD/JPY為替レートを取得する関数（キャッシュ付き）
@@ -100,54 +278,44 @@ def get_exchange_rate(target_date):
     Returns:
     float: USD/JPY為替レート または None
     """
+    try:
+        return _get_exchange_rate_cached(target_date)
+    except LookupError:
+        # 通信エラー等でデータの有無を判断できなかった場合はキャッシュせず、次回の実行で再取得する
+        return None
+
+@st.cache_data(ttl=3600, max_entries=100_000, show_spinner=False)
+def _get_exchange_rate_cached(target_date):
+    """
+    get_exchange_rateの本体
+    データの有無を判断できなかった場合はNoneをキャッシュしないよう LookupError を送出する。
+    """
     # 1. DBキャッシュから取得を試みる
     cached_rate = get_price_from_cache("USDJPY=X", target_date)
     if cached_rate is not None:
         return cached_rate
 
+    # 直近で取得できなかった日付はyfinanceに問い合わせない
+    if is_recent_price_miss("USDJPY=X", target_date):
+        return None
+
     # 2. キャッシュにない場合はyfinanceから取得
     try:
-        # 前後3日間のデータを取得して、指定日に最も近い営業日の為替レートを取得
-        start_date = (pd.Timestamp(target_date) - pd.Timedelta(days=3)).strftime("%Y-%m-%d")
-        end_date = (pd.Timestamp(target_date) + pd.Timedelta(days=3)).strftime("%Y-%m-%d")
-
-        df = yf.download(
-            "USDJPY=X",
-            start=start_date,
-            end=end_date,
-            progress=False,
-            threads=False,
-            auto_adjust=True
-        )
-
-        if df.empty:
-            return None
-
-        # 指定日に最も近い営業日の終値を取得
-        target_timestamp = pd.Timestamp(target_date)
-        available_dates = df.index
-
-        # 指定日以前の最新の営業日を探す
-        valid_dates = available_dates[available_dates <= target_timestamp]
-        if len(valid_dates) > 0:
-            closest_date = valid_dates[-1]
-            close_value = df.loc[closest_date]["Close"]
-            if isinstance(close_value, pd.Series):
-                rate = float(close_value.iloc[0])
-            else:
-                rate = float(close_value)
-
-            # 3. 取得した値をDBキャッシュに保存
-            save_price_to_cache("USDJPY=X", target_date, rate, "FX")
-
-            return rate
+        rate = download_stock_price("USDJPY=X", target_date)
+    except Exception as e:
+        raise LookupError(f"USDJPY=X {target_date}: {e}") from e
 
+    if rate is None:
+        if not is_price_miss_recordable(target_date):
+            raise LookupError(f"USDJPY=X {target_date}: まだデータがありません")
+        save_price_miss("USDJPY=X", target_date)
         return None
 
-    except Exception as e:
-        return None
+    # 3. 取得した値をDBキャッシュに保存
+    save_price_to_cache("USDJPY=X", target_date, rate, "FX")
+
+    return rate
 
-@lru_cache(maxsize=1000)
 def get_stock_price_cached(stock_code, target_date):
     """
     指定日の株価を取得する関数（キャッシュ付き）
@@ -159,217 +327,534 @@ def get_stock_price_cached(stock_code, target_date):
     Returns:
     float: 終値 または None
     """
+    try:
+        return _get_stock_price_cached(stock_code, target_date)
+    except LookupError:
+        # 通信エラー等でデータの有無を判断できなかった場合はキャッシュせず、次回の実行で再取得する
+        return None
+
+@st.cache_data(ttl=3600, max_entries=100_000, show_spinner=False)
+def _get_stock_price_cached(stock_code, target_date):
+    """
+    get_stock_price_cachedの本体
+    データの有無を判断できなかった場合はNoneをキャッシュしないよう LookupError を送出する。
+    """
     # 1. DBキャッシュから取得を試みる
     cached_price = get_price_from_cache(stock_code, target_date)
     if cached_price is not None:
         return cached_price
 
+    # 直近で取得できなかった銘柄・日付はyfinanceに問い合わせない
+    if is_recent_price_miss(stock_code, target_date):
+        return None
+
     # 2. キャッシュにない場合はyfinanceから取得
     try:
-        ticker = get_ticker(stock_code)
-
-        # 前後3日間のデータを取得して、指定日に最も近い営業日の株価を取得
-        start_date = (pd.Timestamp(target_date) - pd.Timedelta(days=3)).strftime("%Y-%m-%d")
-        end_date = (pd.Timestamp(target_date) + pd.Timedelta(days=3)).strftime("%Y-%m-%d")
-
-        df = yf.download(
-            ticker,
-            start=start_date,
-            end=end_date,
-            progress=False,
-            threads=False,
-            auto_adjust=True
-        )
+        price = download_stock_price(stock_code, target_date)
+    except Exception as e:
+        raise LookupError(f"{stock_code} {target_date}: {e}") from e
 
-        if df.empty:
-            return None
+    if price is None:
+        if not is_price_miss_recordable(target_date):
+            raise LookupError(f"{stock_code} {target_date}: まだデータがありません")
+        save_price_miss(stock_code, target_date)
+        return None
 
-        # 指定日に最も近い営業日の終値を取得
-        target_timestamp = pd.Timestamp(target_date)
-        available_dates = df.index
+    # 異常に大きな価格をチェック（例：1株あたり100万円を超える場合は無効）
+    if price > 1000000 or price <= 0:
+        return None
 
-        # 指定日以前の最新の営業日を探す
-        valid_dates = available_dates[available_dates <= target_timestamp]
-        if len(valid_dates) > 0:
-            closest_date = valid_dates[-1]
-            close_value = df.loc[closest_date]["Close"]
-            if isinstance(close_value, pd.Series):
-                price = float(close_value.iloc[0])
-            else:
-                price = float(close_value)
+    # 3. 取得した値をDBキャッシュに保存
+    save_price_to_cache(stock_code, target_date, price, get_price_currency(stock_code))
 
-            # 異常に大きな価格をチェック（例：1株あたり100万円を超える場合は無効）
-            if price > 1000000 or price <= 0:
-                return None
+    return price
 
-            # 3. 取得した値をDBキャッシュに保存
-            # 通貨を判定（日本株かどうか）
-            currency = 'JPY' if stock_code and stock_code[0].isdigit() else 'USD'
-            save_price_to_cache(stock_code, target_date, price, currency)
+def get_price_currency(stock_code):
+    """株価キャッシュに保存する通貨を判定（日本株かどうか）"""
+    return 'JPY' if is_jpy_stock_code(stock_code) else 'USD'
 
-            return price
+def download_stock_price(stock_code, target_date):
+    """
+    yfinanceから指定日以前で最新の営業日の終値を取得（DBキャッシュの参照・保存は行わない）
 
-        return None
+    Parameters:
+    stock_code (str): 銘柄コード
+    target_date (str): 対象日（YYYY-MM-DD形式）
 
-    except Exception as e:
-        return None
+    Returns:
+    float: 終値 または指定日以前のデータがない場合は None
+    （通信エラー等の例外はそのまま送出する。yfinanceは通信エラーやレート制限でも
+    例外ではなく空のDataFrameを返すため、空の応答も例外として扱う）
+    """
+    ticker = get_ticker(stock_code)
+
+    # 前後3日間のデータを取得して、指定日に最も近い営業日の株価を取得
+    start_date = (pd.Timestamp(target_date) - pd.Timedelta(days=3)).strftime("%Y-%m-%d")
+    end_date = (pd.Timestamp(target_date) + pd.Timedelta(days=3)).strftime("%Y-%m-%d")
+
+    df = yf.download(
+        ticker,
+        start=start_date,
+        end=end_date,
+        progress=False,
+        threads=False,
+        auto_adjust=True
+    )
+
+    if df.empty:
+        raise ValueError(f"{ticker} の株価データが空で返されました")
 
-def get_next_business_day(date_obj):
-    """次の営業日を取得（土日をスキップ）"""
-    next_day = date_obj + timedelta(days=1)
-    while next_day.weekday() >= 5:  # 土曜日(5)または日曜日(6)
-        next_day += timedelta(days=1)
-    return next_day
+    return _close_asof(df, target_date)
 
-def get_latest_vote_date(trade_date):
+def _download_stock_price_safely(stock_code, target_date):
     """
-    取引日に対応する直近の投票日を取得（月曜日→土曜日、 水曜日→火曜日）
+    download_stock_priceの例外を握りつぶして (終値, 取得できたか) を返す
+    通信エラー・空の応答時は取得失敗として記録しないため、データなしと区別する。
+    """
+    try:
+        return download_stock_price(stock_code, target_date), True
+    except Exception:
+        return None, False
+
+@st.cache_resource
+def _get_price_fetch_executor():
+    """株価取得用のスレッドプールを取得（ページの再実行ごとにスレッドを作り直さない）"""
+    return ThreadPoolExecutor(max_workers=PRICE_FETCH_WORKERS)
+
+def get_stock_prices_concurrent(stock_codes, target_date):
+    """
+    複数銘柄の指定日の株価をまとめて取得する
+
+    DBキャッシュにある銘柄は1回のクエリでまとめて取得し、キャッシュにない銘柄のみ
+    yfinanceへの問い合わせになるため、スレッドプールで並列に取得する。
+    yfinanceから取得した株価と取得失敗の記録は、最後にまとめて1回ずつDBへ書き込む。
 
     Parameters:
-    trade_date (date): 取引日
+    stock_codes (iterable): 銘柄コード
+    target_date (str): 対象日（YYYY-MM-DD形式）
 
     Returns:
-    date or None: 対応する投票日、該当しない場合はNone
+    dict: {銘柄コード: 終値}（取得できなかった銘柄は含まない）
     """
-    if trade_date is None:
-        return None
+    stock_codes = list(stock_codes)
+    cached_prices = get_prices_from_cache_bulk(stock_codes, target_date)
+
+    missing_codes = [code for code in dict.fromkeys(stock_codes) if code not in cached_prices]
+    if missing_codes:
+        # 直近で取得できなかった銘柄はyfinanceに問い合わせない
+        recent_misses = get_recent_price_misses(missing_codes, target_date)
+        missing_codes = [code for code in missing_codes if code not in recent_misses]
+
+    if len(missing_codes) > 1:
+        executor = _get_price_fetch_executor()
+        downloads = executor.map(lambda code: _download_stock_price_safely(code, target_date), missing_codes)
+    else:
+        downloads = [_download_stock_price_safely(code, target_date) for code in missing_codes]
+
+    updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    new_rows = []
+    new_misses = []
+    for code, (price, fetched) in zip(missing_codes, downloads):
+        if not fetched:
+            continue
+        if price is None:
+            if is_price_miss_recordable(target_date):
+                new_misses.append(code)
+        elif 0 < price <= 1000000:
+            cached_prices[code] = price
+            new_rows.append((code, target_date, price, get_price_currency(code), updated_at))
 
-    weekday = trade_date.weekday()
+    save_prices_to_cache_bulk(new_rows)
+    save_price_misses_bulk(new_misses, target_date)
 
-    # 水曜日の場合は前日の火曜日が投票日
-    if weekday == 2:
-        candidate = trade_date - timedelta(days=1)
-        if candidate.weekday() == 1:
-            return candidate
+    return {code: cached_prices[code] for code in stock_codes if code in cached_prices}
 
-    # 月曜日の場合は2日前の土曜日が投票日
-    if weekday == 0:
-        candidate = trade_date - timedelta(days=2)
-        if candidate.weekday() == 5:
-            return candidate
+def _extract_close_series(df, ticker):
+    """
+    yf.downloadの結果から指定tickerの終値Seriesを取り出す
 
-    return None
+    group_by='ticker' の場合は (ticker, 項目) のMultiIndex列、
+    それ以外の場合は (項目, ticker) または単一階層の列になるため両方に対応する。
+    """
+    if isinstance(df.columns, pd.MultiIndex):
+        if ticker in df.columns.get_level_values(0):
+            sub = df[ticker]
+            return sub['Close'] if 'Close' in sub.columns else None
+        if 'Close' in df.columns.get_level_values(0):
+            close = df['Close']
+            return close[ticker] if ticker in close.columns else None
+        return None
+    return df['Close'] if 'Close' in df.columns else None
 
-def get_vote_results_for_date_separated(vote_date):
-    """指定日の投票結果を日本株と米国株に分けて取得"""
-    conn = get_connection()
-    try:
-        cursor = conn.cursor()
-        
-        # 全投票結果を取得
-        cursor.execute("""
-            SELECT stock_code, COUNT(*) as vote_count
-            FROM vote
-            WHERE vote_date = ?
-            GROUP BY stock_code
-            ORDER BY vote_count DESC
-        """, (vote_date,))
-        
-        all_results = cursor.fetchall()
-        
-        # 日本株と米国株に分ける
-        jpy_stocks = []
-        usd_stocks = []
-        
-        for stock_code, vote_count in all_results:
-            if stock_code and stock_code[0].isdigit():  # 日本株
-                jpy_stocks.append((stock_code, vote_count))
-            elif stock_code:  # 米国株
-                usd_stocks.append((stock_code, vote_count))
-        
-        # それぞれのベスト10を返す
-        return jpy_stocks[:10], usd_stocks[:10]
-    finally:
-        conn.close()
-
-def get_vote_results_for_date(vote_date):
-    """指定日の投票結果を取得"""
-    conn = None
-    try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT stock_code, COUNT(*) as vote_count
-            FROM vote
-            WHERE vote_date = ?
+def prefetch_prices(stock_codes, start_date, end_date):
+    """
+    シミュレーション期間の株価・為替レートを一括でダウンロードしてDBキャッシュに保存する
+
+    銘柄×日付ごとに yf.download を呼ぶ代わりに、キャッシュが不足している銘柄だけを
+    PREFETCH_CHUNK_SIZE銘柄ずつのリクエストでまとめて取得する。保存する値は get_stock_price_cached と同じく
+    「指定日以前3日以内の直近営業日の終値」とする。
+
+    Parameters:
+    stock_codes (list): 銘柄コードのリスト（為替'USDJPY=X'は自動で追加）
+    start_date (date): 開始日
+    end_date (date): 終了日
+    """
+    codes = list(dict.fromkeys([code for code in stock_codes if code] + ["USDJPY=X"]))
+    start_date_str = start_date.strftime("%Y-%m-%d")
+    end_date_str = end_date.strftime("%Y-%m-%d")
+
+    # シミュレーションで参照するのは平日のみ
+    weekdays = pd.bdate_range(start_date, end_date)
+    if len(weekdays) == 0:
+        return
+
+    # 平日分のキャッシュが揃っていない銘柄のみをダウンロード対象にする
+    with shared_connection() as conn:
+        cursor = conn.execute("""
+            SELECT stock_code, COUNT(*)
+            FROM price_cache
+            WHERE date BETWEEN ? AND ? AND strftime('%w', date) NOT IN ('0', '6')
             GROUP BY stock_code
-            ORDER BY vote_count DESC
-            LIMIT 10
-        """, (vote_date,))
-        
-        return cursor.fetchall()
-    finally:
-        if conn is not None:
-            conn.close()
+        """, (start_date_str, end_date_str))
+        cached_counts = dict(cursor.fetchall())
 
-def calculate_trading_cost(trade_value, costs=TRADING_COSTS):
-    """取引コストを計算"""
-    total_cost_rate = costs['commission_rate'] + costs['slippage_rate'] + costs['spread_rate']
-    return trade_value * total_cost_rate
+    ticker_to_code = {
+        get_ticker(code): code for code in codes if cached_counts.get(code, 0) < len(weekdays)
+    }
+    if not ticker_to_code:
+        return
+
+    download_start = (pd.Timestamp(start_date) - pd.Timedelta(days=3)).strftime("%Y-%m-%d")
+    download_end = (pd.Timestamp(end_date) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+    updated_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = []
+
+    # 1回のリクエストが大きくなりすぎないよう、PREFETCH_CHUNK_SIZE銘柄ずつダウンロードする
+    tickers = list(ticker_to_code)
+    for chunk_start in range(0, len(tickers), PREFETCH_CHUNK_SIZE):
+        chunk = tickers[chunk_start:chunk_start + PREFETCH_CHUNK_SIZE]
+        try:
+            df = yf.download(
+                chunk,
+                start=download_start,
+                end=download_end,
+                progress=False,
+                threads=True,
+                auto_adjust=True,
+                group_by='ticker'
+            )
+        except Exception:
+            continue
 
-def calculate_portfolio_value(portfolio, current_prices, exchange_rate=None):
-    """ポートフォリオの現在価値を計算（円換算）"""
-    total_value = 0
-    for i, (stock_code, shares) in enumerate(portfolio.items()):
-        if stock_code in current_prices and current_prices[stock_code] is not None:
-            price = current_prices[stock_code]
-            
-            # 異常な株価をチェック
-            if price <= 0 or price > 1000000:  # 0以下または100万円を超える場合は無効
+        if df is None or df.empty:
+            continue
+
+        for ticker in chunk:
+            code = ticker_to_code[ticker]
+            close = _extract_close_series(df, ticker)
+            if close is None:
                 continue
-            
-            stock_value = shares * price
-            
-            # 米国株の場合は円換算
-            if stock_code and not stock_code[0].isdigit() and exchange_rate is not None:
-                # 異常な為替レートをチェック
-                if exchange_rate <= 0 or exchange_rate > 1000:  # 0以下または1000を超える場合は無効
-                    continue
-                stock_value *= exchange_rate
-            
-            # 異常な評価額をチェック（10兆円を超える場合は無効）
-            if stock_value > 10000000000000:
+            close = close.dropna()
+            if close.empty:
                 continue
-                
-            total_value += stock_value
+            close.index = pd.DatetimeIndex(close.index).tz_localize(None).normalize()
+
+            # 暦日に展開して直近3日以内の終値で埋め、平日のみを取り出す
+            calendar_days = pd.date_range(min(close.index.min(), weekdays[0]), weekdays[-1], freq='D')
+            daily = close.reindex(calendar_days).ffill(limit=3).reindex(weekdays).dropna()
+
+            if code == "USDJPY=X":
+                currency = "FX"
+            else:
+                currency = get_price_currency(code)
+                # 異常な価格は保存しない（get_stock_price_cachedと同じ基準）
+                daily = daily[(daily > 0) & (daily <= 1000000)]
+
+            rows.extend(
+                (code, date_str, price, currency, updated_at)
+                for date_str, price in zip(daily.index.strftime("%Y-%m-%d"), daily.astype(float).tolist())
+            )
+
+    if not rows:
+        return
+
+    with shared_connection() as conn:
+        # 既存のキャッシュ値は変更しない
+        conn.executemany("""
+            INSERT OR IGNORE INTO price_cache
+            (stock_code, date, price, currency, updated_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, rows)
+        conn.commit()
+
+def get_vote_results_by_date(start_date_str, end_date_str, top_n=10):
+    """
+    指定期間の投票結果を1回のクエリで取得し、投票日ごとに日本株と米国株に分ける
+
+    Parameters:
+    start_date_str (str): 開始日（YYYY-MM-DD形式）
+    end_date_str (str): 終了日（YYYY-MM-DD形式）
+    top_n (int): 日本株・米国株それぞれの取得件数
+
+    Returns:
+    dict: {投票日(str): ([(銘柄コード, 投票数), ...], [(銘柄コード, 投票数), ...])}
+    """
+    # 日本株（先頭が数字）と米国株に分類し、投票日・市場ごとに投票数の多い順で上位N件だけをSQL側で絞り込む
+    with shared_connection() as conn:
+        rows = conn.execute("""
+            SELECT vote_date, stock_code, vote_count, is_jpy
+            FROM (
+                SELECT
+                    vote_date,
+                    stock_code,
+                    vote_count,
+                    is_jpy,
+                    ROW_NUMBER() OVER (
+                        PARTITION BY vote_date, is_jpy ORDER BY vote_count DESC, stock_code
+                    ) AS rank_in_market
+                FROM (
+                    SELECT
+                        vote_date,
+                        stock_code,
+                        COUNT(*) AS vote_count,
+                        substr(stock_code, 1, 1) BETWEEN '0' AND '9' AS is_jpy
+                    FROM vote
+                    WHERE vote_date BETWEEN ? AND ? AND stock_code IS NOT NULL AND stock_code != ''
+                    GROUP BY vote_date, stock_code
+                )
+            )
+            WHERE rank_in_market <= ?
+            ORDER BY vote_date, is_jpy, rank_in_market
+        """, (start_date_str, end_date_str, top_n)).fetchall()
+
+    vote_map = {}
+    for vote_date, stock_code, vote_count, is_jpy in rows:
+        jpy_stocks, usd_stocks = vote_map.setdefault(vote_date, ([], []))
+        (jpy_stocks if is_jpy else usd_stocks).append((stock_code, vote_count))
+
+    return vote_map
+
+def calculate_portfolio_value(portfolio, current_prices, exchange_rate=None):
+    """ポートフォリオの現在価値を計算（円換算）"""
+    if not portfolio:
+        return 0
+
+    # 株数と株価を配列にまとめ、有効な銘柄の評価額を内積で一括計算する
+    # （価格が取得できていない銘柄はNaNとなり、下の判定で無効になる）
+    shares = np.fromiter(portfolio.values(), dtype=np.float64, count=len(portfolio))
+    prices = np.array([current_prices.get(stock_code) for stock_code in portfolio], dtype=np.float64)
+
+    # 異常な株価をチェック（0以下または100万円を超える場合は無効）
+    valid = (prices > 0) & (prices <= 1000000)
+
+    # 米国株の場合は円換算（株数に為替レートを掛けておく）
+    if exchange_rate is not None:
+        is_usd = np.fromiter((not is_jpy_stock_code(code) for code in portfolio), dtype=bool, count=len(portfolio))
+        # 異常な為替レート（0以下または1000を超える）の場合は米国株を無効とする
+        if exchange_rate <= 0 or exchange_rate > 1000:
+            valid &= ~is_usd
+        else:
+            shares = np.where(is_usd, shares * exchange_rate, shares)
+
+    # 異常な評価額をチェック（10兆円を超える場合は無効）
+    valid &= shares * prices <= 10000000000000
+
+    return float(np.vdot(shares[valid], prices[valid]))
+
+def get_price_matrix(stock_codes, date_strs):
+    """
+    日付×銘柄の終値の行列を取得
+
+    DBキャッシュから期間分を1回のクエリで読み込み、キャッシュにない値のみ
+    get_stock_prices_concurrentで日ごとに取得する。
+
+    Args:
+        stock_codes: 日付ごとの必要な銘柄コードの集合のリスト（date_strsと同じ長さ）
+        date_strs: 日付文字列（YYYY-MM-DD形式）のリスト（昇順）
+
+    Returns:
+        pd.DataFrame: index=日付文字列、columns=銘柄コードの終値（取得できない値はNaN）
+    """
+    codes = list(dict.fromkeys(code for day_codes in stock_codes for code in day_codes))
+    matrix = pd.DataFrame(np.nan, index=pd.Index(date_strs), columns=pd.Index(codes, dtype=object))
+    if not codes or not date_strs:
+        return matrix
+
+    placeholders = ",".join("?" * len(codes))
+    try:
+        with shared_connection() as conn:
+            rows = conn.execute(f"""
+                SELECT date, stock_code, price FROM price_cache
+                WHERE date BETWEEN ? AND ? AND stock_code IN ({placeholders})
+            """, (date_strs[0], date_strs[-1], *codes)).fetchall()
+    except Exception:
+        rows = []
+
+    if rows:
+        cached = pd.DataFrame(rows, columns=['date', 'stock_code', 'price']).pivot(
+            index='date', columns='stock_code', values='price'
+        )
+        matrix = cached.reindex(index=matrix.index, columns=matrix.columns).astype(np.float64)
+
+    # キャッシュにない値は日ごとにまとめて取得（yfinanceへのフォールバックを含む）
+    missing = matrix.isna().to_numpy()
+    column_index = {code: i for i, code in enumerate(codes)}
+    for row, (date_str, day_codes) in enumerate(zip(date_strs, stock_codes)):
+        missing_codes = [code for code in day_codes if missing[row, column_index[code]]]
+        if missing_codes:
+            for code, price in get_stock_prices_concurrent(missing_codes, date_str).items():
+                matrix.iat[row, column_index[code]] = price
+
+    return matrix
+
+def calculate_daily_portfolio_values(portfolios, price_matrix, exchange_rates=None):
+    """
+    日々のポートフォリオ価値（円換算）をまとめて計算
+
+    保有株数（日付×銘柄）と終値の行列の要素積を行ごとに合計する。
+    無効な株価・為替レート・評価額の判定はcalculate_portfolio_valueと同じ。
+
+    Args:
+        portfolios: 各日の保有状況 {stock_code: shares} のリスト（price_matrixの行に対応）
+        price_matrix: get_price_matrixの戻り値
+        exchange_rates: 各日の為替レートの配列（米国株を円換算する場合のみ指定）
+
+    Returns:
+        np.ndarray: 各日のポートフォリオ価値
+    """
+    column_index = {code: i for i, code in enumerate(price_matrix.columns)}
+    n_days, n_codes = price_matrix.shape
+
+    # 保有状況は取引日にのみ差し替わるため、同じ辞書の行は一度だけ作る
+    rows_by_portfolio = {}
+    share_rows = []
+    for portfolio in portfolios:
+        row = rows_by_portfolio.get(id(portfolio))
+        if row is None:
+            row = np.zeros(n_codes)
+            for stock_code, shares in portfolio.items():
+                row[column_index[stock_code]] = shares
+            rows_by_portfolio[id(portfolio)] = row
+        share_rows.append(row)
+    shares = np.vstack(share_rows) if share_rows else np.zeros((n_days, n_codes))
+
+    # 価格が取得できている銘柄のみを対象とし、異常な株価（0以下または100万円超）は無効とする
+    prices = price_matrix.to_numpy(dtype=np.float64)
+    has_price = ~np.isnan(prices)
+    prices = np.where(has_price, prices, 0.0)
+    valid = has_price & (prices > 0) & (prices <= 1000000)
+    stock_values = shares * prices
+
+    # 米国株の場合は円換算（異常な為替レートの日は米国株を無効とする）
+    if exchange_rates is not None:
+        rates = np.asarray(exchange_rates, dtype=np.float64)[:, None]
+        is_usd = np.array([not is_jpy_stock_code(code) for code in price_matrix.columns], dtype=bool)
+        rate_ok = (rates > 0) & (rates <= 1000)
+        valid &= ~(is_usd & ~rate_ok)
+        stock_values = np.where(is_usd & rate_ok, stock_values * rates, stock_values)
+
+    # 異常な評価額をチェック（10兆円を超える場合は無効）
+    valid &= stock_values <= 10000000000000
+
+    return np.where(valid, stock_values, 0.0).sum(axis=1)
+
+def fill_daily_values(simulation_results, date_strs, initial_total_value):
+    """
+    シミュレーション結果に終値でのポートフォリオ価値・総資産・日次損益率を記入
+
+    Args:
+        simulation_results: simulate_investmentの結果（日付順）
+        date_strs: 各結果の日付文字列
+        initial_total_value: 初期投資額（初日の日次損益率の基準）
+    """
+    if not simulation_results:
+        return
+
+    jpy_portfolios = [result['jpy_portfolio'] for result in simulation_results]
+    usd_portfolios = [result['usd_portfolio'] for result in simulation_results]
+    exchange_rates = np.fromiter(
+        (result['exchange_rate'] for result in simulation_results), dtype=np.float64, count=len(simulation_results)
+    )
+
+    price_matrix = get_price_matrix(
+        [list(jpy) + list(usd) for jpy, usd in zip(jpy_portfolios, usd_portfolios)], date_strs
+    )
+    jpy_values = calculate_daily_portfolio_values(jpy_portfolios, price_matrix)
+    usd_values = calculate_daily_portfolio_values(usd_portfolios, price_matrix, exchange_rates)
+
+    # 当日の総資産価値を計算（すべて円換算）
+    jpy_cash = np.fromiter((result['jpy_cash'] for result in simulation_results), dtype=np.float64)
+    usd_cash = np.fromiter((result['usd_cash'] for result in simulation_results), dtype=np.float64)
+    total_values = jpy_values + jpy_cash + usd_values + usd_cash * exchange_rates
+
+    # 前日終値との比較で日次損益率を計算（取引日は取引による影響も含まれる）
+    previous_values = np.concatenate(([initial_total_value], total_values[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pnl_rates = np.where(
+            previous_values > 0, ((total_values - previous_values) / previous_values) * 100, 0.0
+        )
+
+    for result, total_value, jpy_value, usd_value, pnl_rate in zip(
+        simulation_results, total_values.tolist(), jpy_values.tolist(), usd_values.tolist(), pnl_rates.tolist()
+    ):
+        result['total_value'] = total_value
+        result['jpy_portfolio_value'] = jpy_value
+        result['usd_portfolio_value'] = usd_value
+        result['daily_pnl_rate'] = pnl_rate
+
+def prepare_target_candidates(stocks, allocation_weights, prices):
+    """
+    目標ポートフォリオの計算対象（銘柄コード・株価・配分比率）をまとめる
+    暫定と最終の目標ポートフォリオは投資額だけが異なるため、取引日ごとに1回だけ作成して使い回す。
+    
+    Args:
+        stocks: [(stock_code, vote_count), ...] の形式の株式リスト
+        allocation_weights: 各銘柄の配分比率（割合）のNumPy配列（シミュレーション開始時に計算済み）
+        prices: 取引日の株価 {stock_code: price, ...}
     
-    return total_value
+    Returns:
+        tuple: (銘柄コードのリスト, 株価のNumPy配列, 配分比率のNumPy配列)
+    """
+    count = min(len(stocks), len(allocation_weights))
+    stock_codes = [stock_code for stock_code, _ in stocks[:count]]
+    stock_prices = np.array(
+        [prices.get(stock_code, np.nan) for stock_code in stock_codes], dtype=np.float64
+    )
+    return stock_codes, stock_prices, allocation_weights[:count]
 
-def calculate_target_portfolio(stocks, allocation_ratios, investment_value, trade_date_str):
+def calculate_target_portfolio(candidates, investment_value):
     """
     目標ポートフォリオを計算
     
     Args:
-        stocks: [(stock_code, vote_count), ...] の形式の株式リスト
-        allocation_ratios: 各銘柄の配分比率のリスト（%）
+        candidates: prepare_target_candidates の戻り値
         investment_value: 投資額（円またはドル）
-        trade_date_str: 取引日（株価取得用）
     
     Returns:
         dict: {stock_code: target_shares, ...} の形式の目標ポートフォリオ
     """
-    target_portfolio = {}
-    
-    for i, (stock_code, vote_count) in enumerate(stocks):
-        if i < len(allocation_ratios):
-            allocation_ratio = allocation_ratios[i] / 100.0
-            target_value = investment_value * allocation_ratio
-            
-            price = get_stock_price_cached(stock_code, trade_date_str)
-            if price is not None and price > 0:
-                trading_cost = calculate_trading_cost(target_value)
-                net_value = target_value - trading_cost
-                target_shares = int(net_value / price)
-                
-                if target_shares > 0:
-                    target_portfolio[stock_code] = target_shares
-    
-    return target_portfolio
+    stock_codes, stock_prices, allocation_weights = candidates
+    if not stock_codes:
+        return {}
+
+    # 配分額から取引コストを差し引いた金額で購入できる株数（小数点以下切り捨て）
+    target_values = investment_value * allocation_weights
+    net_values = target_values - target_values * TOTAL_COST_RATE
+    with np.errstate(divide='ignore', invalid='ignore'):
+        target_shares = np.trunc(net_values / stock_prices)
+
+    # 株価が取得できない銘柄・購入株数が0以下の銘柄は対象外
+    valid = (stock_prices > 0) & (target_shares > 0)
+
+    return {
+        stock_code: int(shares)
+        for stock_code, shares, is_valid in zip(stock_codes, target_shares, valid)
+        if is_valid
+    }
 
-def calculate_required_sale_proceeds(current_portfolio, target_portfolio, current_prices):
+def calculate_reduction_sell_values(current_portfolio, target_portfolio, current_prices):
     """
-    減額売却が必要な場合の売却額を計算
+    目標ポートフォリオに合わせて減額売却する場合の売却額を銘柄ごとに一括計算
     
     Args:
         current_portfolio: 現在のポートフォリオ {stock_code: shares, ...}
@@ -377,23 +862,30 @@ def calculate_required_sale_proceeds(current_portfolio, target_portfolio, curren
         current_prices: 現在の株価 {stock_code: price, ...}
     
     Returns:
-        float: 売却による純現金増加額（取引コスト控除後）
+        np.ndarray: current_portfolioの順の売却額（減額不要・株価がない銘柄は0）
+    """
+    count = len(current_portfolio)
+    current_shares = np.fromiter(current_portfolio.values(), dtype=np.float64, count=count)
+    target_shares = np.fromiter(
+        (target_portfolio.get(stock_code, 0) for stock_code in current_portfolio), dtype=np.float64, count=count
+    )
+    prices = np.array([current_prices.get(stock_code) for stock_code in current_portfolio], dtype=np.float64)
+
+    shares_to_sell = current_shares - target_shares
+    to_sell = (shares_to_sell > 0) & ~np.isnan(prices)
+    return np.where(to_sell, shares_to_sell * np.nan_to_num(prices), 0.0)
+
+def calculate_required_sale_proceeds(sell_values):
     """
-    total_proceeds = 0
+    減額売却が必要な場合の売却額を計算
     
-    for stock_code, current_shares in current_portfolio.items():
-        target_shares = target_portfolio.get(stock_code, 0)
-        
-        if target_shares < current_shares:
-            shares_to_sell = current_shares - target_shares
-            
-            if stock_code in current_prices and current_prices[stock_code] is not None:
-                sell_price = current_prices[stock_code]
-                sell_value = shares_to_sell * sell_price
-                sell_cost = calculate_trading_cost(sell_value)
-                total_proceeds += sell_value - sell_cost
+    Args:
+        sell_values: calculate_reduction_sell_values で計算した銘柄ごとの売却額
     
-    return total_proceeds
+    Returns:
+        float: 売却による純現金増加額（取引コスト控除後）
+    """
+    return float((sell_values - sell_values * TOTAL_COST_RATE).sum())
 
 def calculate_total_asset_value(jpy_portfolio_value, jpy_cash, usd_portfolio_value, usd_cash, exchange_rate):
     """
@@ -417,35 +909,49 @@ def calculate_total_asset_value(jpy_portfolio_value, jpy_cash, usd_portfolio_val
         total += usd_portfolio_value + (usd_cash * exchange_rate)
     return total
 
+# 取引履歴の列（simulate_investment は列ごとのリストに追記し、最後にDataFrameへ変換する）
+TRADE_HISTORY_COLUMNS = [
+    'date', 'vote_date', 'stock_code', 'stock_name', 'action', 'shares',
+    'price', 'value', 'currency', 'exchange_rate', 'buy_price', 'sell_price'
+]
+
+def _append_trade(trade_columns, trade):
+    """取引1件を列ごとのリストに追加（存在しない項目は None とする）"""
+    for column, values in trade_columns.items():
+        values.append(trade.get(column))
+
 def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allocation_ratios, usd_allocation_ratios):
     """投資シミュレーションを実行"""
 
     # シミュレーション結果を格納するリスト
     simulation_results = []
 
-    # 取引履歴を格納するリスト
-    trade_history = []
+    # 取引履歴を列ごとのリストに格納（最後にDataFrameへ変換）
+    trade_columns = {column: [] for column in TRADE_HISTORY_COLUMNS}
 
     # 初期ポートフォリオ
+    # 保有状況の辞書は取引日に新しいものへ差し替え、差し替え後は変更しない
+    # （日々の結果には同じ辞書を共有させ、日数分のコピーを作らないため）
     jpy_portfolio = {}
     usd_portfolio = {}
     jpy_cash = initial_jpy
 
     # 米国株の初期資金を円からドルに変換（開始日の為替レートを使用）
     start_date_str = start_date.strftime("%Y-%m-%d")
+    end_date_str = end_date.strftime("%Y-%m-%d")
     initial_exchange_rate = get_exchange_rate(start_date_str)
     if initial_exchange_rate is None or initial_exchange_rate <= 0:
         st.error(f"開始日の為替レートが取得できませんでした: {start_date_str}")
-        return [], []
+        return [], pd.DataFrame(columns=TRADE_HISTORY_COLUMNS)
 
     usd_cash = initial_usd / initial_exchange_rate  # 円→ドルに変換
 
     # 初期価値を記録（円換算）
     initial_total_value = initial_jpy + initial_usd
 
-    # 火曜日と土曜日の投票日を取得
-    current_date = start_date
-    previous_total_value = initial_total_value  # 前日の総資産価値を記録
+    # 配分比率（%）は期間中変わらないため、割合の配列にして一度だけ計算しておく
+    jpy_allocation_weights = np.asarray(jpy_allocation_ratios, dtype=np.float64) / 100.0
+    usd_allocation_weights = np.asarray(usd_allocation_ratios, dtype=np.float64) / 100.0
 
     # プログレスバー用の計算
     total_days = (end_date - start_date).days + 1
@@ -454,54 +960,93 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
     progress_bar = st.progress(0)
     status_text = st.empty()
 
-    while current_date <= end_date:
-        # 進捗を更新（現在の日付の位置で計算）
+    # 期間中の投票結果は1回のクエリでまとめて取得しておく（投票日ごとのSQLを避ける）
+    vote_start_str = (start_date - timedelta(days=2)).strftime("%Y-%m-%d")
+    vote_map = get_vote_results_by_date(vote_start_str, end_date_str)
+
+    # 期間中の候補銘柄と為替レートを一括取得してキャッシュしておく
+    # （取引日ごと・銘柄ごとの個別ダウンロードを避ける）
+    status_text.text("株価データを一括取得中...")
+    candidate_codes = [
+        stock_code
+        for jpy_stocks, usd_stocks in vote_map.values()
+        for stock_code, _ in jpy_stocks + usd_stocks
+    ]
+    prefetch_prices(candidate_codes, start_date, end_date)
+
+    # 期間中の為替レートはDBキャッシュから辞書にまとめて読み込んでおく（キャッシュにない日のみ個別に取得）
+    cached_exchange_rates = get_prices_from_cache_for_period("USDJPY=X", start_date_str, end_date_str)
+
+    # 取引履歴に記録する銘柄名も候補銘柄分をまとめて取得しておく（銘柄マスタにない銘柄は取引時に個別取得）
+    stock_names = get_stock_names(candidate_codes)
+
+    # 営業日（土日を除く）と、取引日→投票日の対応を事前に計算しておく
+    # 火曜日・土曜日の投票の翌営業日（水曜・月曜）が取引日となる
+    business_days = pd.bdate_range(start_date, end_date).date
+    vote_dates = pd.date_range(start_date - timedelta(days=2), end_date, freq='W-TUE').union(
+        pd.date_range(start_date - timedelta(days=2), end_date, freq='W-SAT')
+    )
+    trade_vote_dates = dict(zip((vote_dates + pd.offsets.BDay(1)).date, vote_dates.date))
+
+    # 結果を記録した日の日付文字列（終値の一括取得に使う）
+    valuation_date_strs = []
+
+    # 進捗表示の更新間隔と、最後に更新した経過日数
+    progress_interval = max(PROGRESS_UPDATE_INTERVAL_DAYS, total_days // MAX_PROGRESS_UPDATES)
+    last_progress_day = -progress_interval
+
+    for current_date in business_days:
+        # 日付文字列は1日1回だけ生成して使い回す
+        current_date_str = current_date.isoformat()
+
+        # 進捗を更新（現在の日付の位置で計算、一定日数ごとにのみ表示を更新）
         days_elapsed = (current_date - start_date).days + 1
-        progress = min(days_elapsed / total_days, 1.0)
-        progress_bar.progress(progress)
-        status_text.text(f"処理中: {current_date.strftime('%Y-%m-%d')} ({days_elapsed}/{total_days}日, {progress*100:.1f}%)")
-        
-        # 土日をスキップ（市場が開いていない日）
-        if current_date.weekday() >= 5:
-            current_date += timedelta(days=1)
-            continue
+        if days_elapsed - last_progress_day >= progress_interval:
+            last_progress_day = days_elapsed
+            progress = min(days_elapsed / total_days, 1.0)
+            progress_bar.progress(progress)
+            status_text.text(f"処理中: {current_date_str} ({days_elapsed}/{total_days}日, {progress*100:.1f}%)")
 
         # 為替レートを取得（毎日必要）
-        exchange_rate = get_exchange_rate(current_date.strftime("%Y-%m-%d"))
+        exchange_rate = cached_exchange_rates.get(current_date_str)
+        if exchange_rate is None:
+            exchange_rate = get_exchange_rate(current_date_str)
         if exchange_rate is None or exchange_rate <= 0:
-            current_date += timedelta(days=1)
             continue
 
         # 取引処理: 火曜日・土曜日の投票翌営業日（月曜・水曜）に取引を実施
-        vote_date = get_latest_vote_date(current_date)
+        vote_date = trade_vote_dates.get(current_date)
         is_trade_day = vote_date is not None
 
         # 取引コストを初期化（取引日の場合のみ使用）
+        # 米国株の取引コストはドル建てで合計し、取引の最後に1回だけ円換算する
         total_trading_cost = 0
+        total_trading_cost_usd = 0
 
         if is_trade_day:
-            vote_date_str = vote_date.strftime("%Y-%m-%d")
-            jpy_stocks, usd_stocks = get_vote_results_for_date_separated(vote_date_str)
+            vote_date_str = vote_date.isoformat()
+            jpy_stocks, usd_stocks = vote_map.get(vote_date_str, ([], []))
 
             if jpy_stocks or usd_stocks:
                 # 今日が取引日
                 trade_date = current_date
+                trade_date_str = current_date_str
+
+                # 投票結果に含まれる銘柄コード（保有銘柄の売却判定用）
+                jpy_vote_codes = {sc for sc, _ in jpy_stocks}
+                usd_vote_codes = {sc for sc, _ in usd_stocks}
 
                 # 現在のポートフォリオ価値を計算
-                current_jpy_prices = {}
-                current_usd_prices = {}
-
-                # 日本株の現在価格を取得
-                for stock_code in jpy_portfolio.keys():
-                    price = get_stock_price_cached(stock_code, trade_date.strftime("%Y-%m-%d"))
-                    if price is not None:
-                        current_jpy_prices[stock_code] = price
-                
-                # 米国株の現在価格を取得
-                for stock_code in usd_portfolio.keys():
-                    price = get_stock_price_cached(stock_code, trade_date.strftime("%Y-%m-%d"))
-                    if price is not None:
-                        current_usd_prices[stock_code] = price
+                # 日本株・米国株の現在価格を並列で取得
+                # （購入候補の銘柄もここで取得し、目標ポートフォリオ計算時はキャッシュから引く）
+                price_codes = dict.fromkeys(
+                    list(jpy_portfolio) + list(usd_portfolio)
+                    + [sc for sc, _ in jpy_stocks[:len(jpy_allocation_ratios)]]
+                    + [sc for sc, _ in usd_stocks[:len(usd_allocation_ratios)]]
+                )
+                current_prices = get_stock_prices_concurrent(price_codes, trade_date_str)
+                current_jpy_prices = {code: current_prices[code] for code in jpy_portfolio if code in current_prices}
+                current_usd_prices = {code: current_prices[code] for code in usd_portfolio if code in current_prices}
                 
                 # --- 日本株の差分調整 ---
                 # 日本株の差分売買を実行
@@ -513,25 +1058,25 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                 temp_jpy_portfolio = jpy_portfolio.copy()
                 for stock_code, current_shares in jpy_portfolio.items():
                     # 投票結果にこの銘柄が含まれているか確認
-                    in_vote_results = any(sc == stock_code for sc, _ in jpy_stocks)
+                    in_vote_results = stock_code in jpy_vote_codes
                     
                     if not in_vote_results:
                         # 投票結果に含まれていない銘柄は全売却
-                        if stock_code in current_jpy_prices and current_jpy_prices[stock_code] is not None:
-                            sell_price = current_jpy_prices[stock_code]
+                        sell_price = current_jpy_prices.get(stock_code)
+                        if sell_price is not None:
                             sell_value = current_shares * sell_price
-                            sell_cost = calculate_trading_cost(sell_value)
+                            sell_cost = sell_value * TOTAL_COST_RATE
 
                             # 売却による現金増加（手数料を差し引く）
                             jpy_cash_from_sales += sell_value - sell_cost
                             total_trading_cost += sell_cost
 
                             # 取引履歴に記録
-                            trade_history.append({
+                            _append_trade(trade_columns, {
                                 'date': trade_date,
                                 'vote_date': vote_date,
                                 'stock_code': stock_code,
-                                'stock_name': get_stock_name(stock_code),
+                                'stock_name': stock_names.get(stock_code) or get_stock_name(stock_code),
                                 'action': '売却',
                                 'shares': current_shares,
                                 'price': sell_price,
@@ -556,15 +1101,17 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                 else:
                     temp_jpy_investment_value = temp_jpy_portfolio_value + jpy_cash  # 円
 
-                # 暫定の目標ポートフォリオを計算
-                temp_target_jpy_portfolio = calculate_target_portfolio(
-                    jpy_stocks, jpy_allocation_ratios, temp_jpy_investment_value, trade_date.strftime("%Y-%m-%d")
+                # 暫定の目標ポートフォリオを計算（対象銘柄の株価・配分比率は最終の計算でも使い回す）
+                jpy_target_candidates = prepare_target_candidates(
+                    jpy_stocks, jpy_allocation_weights, current_prices
                 )
+                temp_target_jpy_portfolio = calculate_target_portfolio(jpy_target_candidates, temp_jpy_investment_value)
 
                 # 減額売却が必要な場合の追加売却額を計算
-                additional_cash_from_sales = calculate_required_sale_proceeds(
+                jpy_reduction_sell_values = calculate_reduction_sell_values(
                     temp_jpy_portfolio, temp_target_jpy_portfolio, current_jpy_prices
                 )
+                additional_cash_from_sales = calculate_required_sale_proceeds(jpy_reduction_sell_values)
 
                 # すべての売却後の最終投資額を計算
                 final_jpy_cash = jpy_cash + additional_cash_from_sales
@@ -578,12 +1125,7 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                     # 減額売却後のポートフォリオ価値を計算
                     final_jpy_portfolio_value = temp_jpy_portfolio_value
                     # 減額売却される株の価値を差し引く
-                    for stock_code, current_shares in temp_jpy_portfolio.items():
-                        target_shares = temp_target_jpy_portfolio.get(stock_code, 0)
-                        if target_shares < current_shares:
-                            shares_to_sell = current_shares - target_shares
-                            if stock_code in current_jpy_prices and current_jpy_prices[stock_code] is not None:
-                                final_jpy_portfolio_value -= shares_to_sell * current_jpy_prices[stock_code]
+                    final_jpy_portfolio_value -= jpy_reduction_sell_values.sum()
                     
                     # すべての売却後のポートフォリオ価値に基づいて日本株と米国株の資金を配分
                     jpy_investment_value = final_jpy_portfolio_value + final_jpy_cash  # 円
@@ -592,9 +1134,7 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                     usd_investment_value_usd = usd_portfolio_value_usd + usd_cash  # ドル
 
                 # 新しい目標ポートフォリオを計算（すべての売却後の投資額を使用）
-                target_jpy_portfolio = calculate_target_portfolio(
-                    jpy_stocks, jpy_allocation_ratios, jpy_investment_value, trade_date.strftime("%Y-%m-%d")
-                )
+                target_jpy_portfolio = calculate_target_portfolio(jpy_target_candidates, jpy_investment_value)
 
                 # 3. 保有銘柄の調整（減額が必要な場合の売却）を実行
                 for stock_code, current_shares in temp_jpy_portfolio.items():
@@ -604,20 +1144,20 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                         # 売却が必要
                         shares_to_sell = current_shares - target_shares
 
-                        if stock_code in current_jpy_prices and current_jpy_prices[stock_code] is not None:
-                            sell_price = current_jpy_prices[stock_code]
+                        sell_price = current_jpy_prices.get(stock_code)
+                        if sell_price is not None:
                             sell_value = shares_to_sell * sell_price
-                            sell_cost = calculate_trading_cost(sell_value)
+                            sell_cost = sell_value * TOTAL_COST_RATE
 
                             # 取引コストを記録
                             total_trading_cost += sell_cost
 
                             # 取引履歴に記録
-                            trade_history.append({
+                            _append_trade(trade_columns, {
                                 'date': trade_date,
                                 'vote_date': vote_date,
                                 'stock_code': stock_code,
-                                'stock_name': get_stock_name(stock_code),
+                                'stock_name': stock_names.get(stock_code) or get_stock_name(stock_code),
                                 'action': '売却',
                                 'shares': shares_to_sell,
                                 'price': sell_price,
@@ -640,10 +1180,10 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                         # 購入が必要
                         shares_to_buy = target_shares - current_shares
 
-                        price = get_stock_price_cached(stock_code, trade_date.strftime("%Y-%m-%d"))
+                        price = current_prices.get(stock_code)
                         if price is not None and price > 0:
                             buy_value = shares_to_buy * price
-                            buy_cost = calculate_trading_cost(buy_value)
+                            buy_cost = buy_value * TOTAL_COST_RATE
                             total_cost = buy_value + buy_cost
 
                             # 現金が足りる場合のみ購入
@@ -653,11 +1193,11 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                                 total_trading_cost += buy_cost
 
                                 # 取引履歴に記録
-                                trade_history.append({
+                                _append_trade(trade_columns, {
                                     'date': trade_date,
                                     'vote_date': vote_date,
                                     'stock_code': stock_code,
-                                    'stock_name': get_stock_name(stock_code),
+                                    'stock_name': stock_names.get(stock_code) or get_stock_name(stock_code),
                                     'action': '購入',
                                     'shares': shares_to_buy,
                                     'price': price,
@@ -672,39 +1212,39 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                                 temp_jpy_portfolio[stock_code] = target_shares
                             else:
                                 # 現金が足りない場合は、購入できる分だけ購入
-                                available_shares = int((jpy_cash * 0.99) / (price * (1 + TRADING_COSTS['commission_rate'] + TRADING_COSTS['slippage_rate'] + TRADING_COSTS['spread_rate'])))
+                                available_shares = int((jpy_cash * 0.99) / (price * (1 + TOTAL_COST_RATE)))
                                 if available_shares > 0:
                                     shares_to_buy = available_shares
                                     buy_value = shares_to_buy * price
-                                    buy_cost = calculate_trading_cost(buy_value)
+                                    buy_cost = buy_value * TOTAL_COST_RATE
                                     total_cost = buy_value + buy_cost
 
-                                    if total_cost <= jpy_cash:
-                                        jpy_cash -= total_cost
-                                        jpy_cash_for_purchases += total_cost
-                                        total_trading_cost += buy_cost
-
-                                        # 取引履歴に記録
-                                        trade_history.append({
-                                            'date': trade_date,
-                                            'vote_date': vote_date,
-                                            'stock_code': stock_code,
-                                            'stock_name': get_stock_name(stock_code),
-                                            'action': '購入',
-                                            'shares': shares_to_buy,
-                                            'price': price,
-                                            'value': buy_value,
-                                            'currency': 'JPY',
-                                            'exchange_rate': None,
-                                            'buy_price': price,
-                                            'sell_price': None
-                                        })
-
-                                        # 一時ポートフォリオを更新
-                                        temp_jpy_portfolio[stock_code] = current_shares + shares_to_buy
+                                    # 現金の99%以内で株数を切り捨てているため、コスト込みでも現金を超えない
+                                    jpy_cash -= total_cost
+                                    jpy_cash_for_purchases += total_cost
+                                    total_trading_cost += buy_cost
+
+                                    # 取引履歴に記録
+                                    _append_trade(trade_columns, {
+                                        'date': trade_date,
+                                        'vote_date': vote_date,
+                                        'stock_code': stock_code,
+                                        'stock_name': stock_names.get(stock_code) or get_stock_name(stock_code),
+                                        'action': '購入',
+                                        'shares': shares_to_buy,
+                                        'price': price,
+                                        'value': buy_value,
+                                        'currency': 'JPY',
+                                        'exchange_rate': None,
+                                        'buy_price': price,
+                                        'sell_price': None
+                                    })
+
+                                    # 一時ポートフォリオを更新
+                                    temp_jpy_portfolio[stock_code] = current_shares + shares_to_buy
 
                 # 日本株ポートフォリオを更新
-                jpy_portfolio = temp_jpy_portfolio.copy()
+                jpy_portfolio = temp_jpy_portfolio
 
                 # --- 米国株の差分調整 ---
                 # 米国株の差分売買を実行
@@ -715,25 +1255,25 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                 temp_usd_portfolio = usd_portfolio.copy()
                 for stock_code, current_shares in usd_portfolio.items():
                     # 投票結果にこの銘柄が含まれているか確認
-                    in_vote_results = any(sc == stock_code for sc, _ in usd_stocks)
+                    in_vote_results = stock_code in usd_vote_codes
                     
                     if not in_vote_results:
                         # 投票結果に含まれていない銘柄は全売却
-                        if stock_code in current_usd_prices and current_usd_prices[stock_code] is not None:
-                            sell_price = current_usd_prices[stock_code]
+                        sell_price = current_usd_prices.get(stock_code)
+                        if sell_price is not None:
                             sell_value_usd = current_shares * sell_price
-                            sell_cost_usd = calculate_trading_cost(sell_value_usd)
+                            sell_cost_usd = sell_value_usd * TOTAL_COST_RATE
 
                             # 売却による現金増加（手数料を差し引く、ドル建て）
                             usd_cash_from_sales += sell_value_usd - sell_cost_usd
-                            total_trading_cost += sell_cost_usd * exchange_rate  # 円換算
+                            total_trading_cost_usd += sell_cost_usd
 
                             # 取引履歴に記録
-                            trade_history.append({
+                            _append_trade(trade_columns, {
                                 'date': trade_date,
                                 'vote_date': vote_date,
                                 'stock_code': stock_code,
-                                'stock_name': get_stock_name(stock_code),
+                                'stock_name': stock_names.get(stock_code) or get_stock_name(stock_code),
                                 'action': '売却',
                                 'shares': current_shares,
                                 'price': sell_price,
@@ -768,15 +1308,17 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                 else:
                     temp_usd_investment_value_usd = temp_usd_portfolio_value_usd + usd_cash  # ドル
 
-                # 暫定の目標ポートフォリオを計算
-                temp_target_usd_portfolio = calculate_target_portfolio(
-                    usd_stocks, usd_allocation_ratios, temp_usd_investment_value_usd, trade_date.strftime("%Y-%m-%d")
+                # 暫定の目標ポートフォリオを計算（対象銘柄の株価・配分比率は最終の計算でも使い回す）
+                usd_target_candidates = prepare_target_candidates(
+                    usd_stocks, usd_allocation_weights, current_prices
                 )
+                temp_target_usd_portfolio = calculate_target_portfolio(usd_target_candidates, temp_usd_investment_value_usd)
 
                 # 減額売却が必要な場合の追加売却額を計算
-                additional_usd_cash_from_sales = calculate_required_sale_proceeds(
+                usd_reduction_sell_values = calculate_reduction_sell_values(
                     temp_usd_portfolio, temp_target_usd_portfolio, current_usd_prices
                 )
+                additional_usd_cash_from_sales = calculate_required_sale_proceeds(usd_reduction_sell_values)
 
                 # すべての売却後の最終投資額を計算
                 final_usd_cash = usd_cash + additional_usd_cash_from_sales
@@ -789,20 +1331,13 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                     # 減額売却後のポートフォリオ価値を計算（ドル建て）
                     final_usd_portfolio_value_usd = temp_usd_portfolio_value_usd
                     # 減額売却される株の価値を差し引く
-                    for stock_code, current_shares in temp_usd_portfolio.items():
-                        target_shares = temp_target_usd_portfolio.get(stock_code, 0)
-                        if target_shares < current_shares:
-                            shares_to_sell = current_shares - target_shares
-                            if stock_code in current_usd_prices and current_usd_prices[stock_code] is not None:
-                                final_usd_portfolio_value_usd -= shares_to_sell * current_usd_prices[stock_code]
+                    final_usd_portfolio_value_usd -= usd_reduction_sell_values.sum()
                     
                     # すべての売却後のポートフォリオ価値に基づいて米国株の資金を配分（ドル建て）
                     usd_investment_value_usd = final_usd_portfolio_value_usd + final_usd_cash  # ドル
 
                 # 新しい目標ポートフォリオを計算（すべての売却後の投資額を使用）
-                target_usd_portfolio = calculate_target_portfolio(
-                    usd_stocks, usd_allocation_ratios, usd_investment_value_usd, trade_date.strftime("%Y-%m-%d")
-                )
+                target_usd_portfolio = calculate_target_portfolio(usd_target_candidates, usd_investment_value_usd)
 
                 # 3. 保有銘柄の調整（減額が必要な場合の売却）を実行
                 for stock_code, current_shares in temp_usd_portfolio.items():
@@ -812,20 +1347,20 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                         # 売却が必要
                         shares_to_sell = current_shares - target_shares
 
-                        if stock_code in current_usd_prices and current_usd_prices[stock_code] is not None:
-                            sell_price = current_usd_prices[stock_code]
+                        sell_price = current_usd_prices.get(stock_code)
+                        if sell_price is not None:
                             sell_value_usd = shares_to_sell * sell_price
-                            sell_cost_usd = calculate_trading_cost(sell_value_usd)
+                            sell_cost_usd = sell_value_usd * TOTAL_COST_RATE
 
                             # 取引コストを記録
-                            total_trading_cost += sell_cost_usd * exchange_rate  # 円換算
+                            total_trading_cost_usd += sell_cost_usd
 
                             # 取引履歴に記録
-                            trade_history.append({
+                            _append_trade(trade_columns, {
                                 'date': trade_date,
                                 'vote_date': vote_date,
                                 'stock_code': stock_code,
-                                'stock_name': get_stock_name(stock_code),
+                                'stock_name': stock_names.get(stock_code) or get_stock_name(stock_code),
                                 'action': '売却',
                                 'shares': shares_to_sell,
                                 'price': sell_price,
@@ -848,24 +1383,24 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                         # 購入が必要
                         shares_to_buy = target_shares - current_shares
 
-                        price = get_stock_price_cached(stock_code, trade_date.strftime("%Y-%m-%d"))
+                        price = current_prices.get(stock_code)
                         if price is not None and price > 0:
                             buy_value_usd = shares_to_buy * price
-                            buy_cost_usd = calculate_trading_cost(buy_value_usd)
+                            buy_cost_usd = buy_value_usd * TOTAL_COST_RATE
                             total_cost_usd = buy_value_usd + buy_cost_usd
 
                             # 現金が足りる場合のみ購入（ドル建て）
                             if total_cost_usd <= usd_cash:
                                 usd_cash -= total_cost_usd
                                 usd_cash_for_purchases += total_cost_usd
-                                total_trading_cost += buy_cost_usd * exchange_rate  # 円換算
+                                total_trading_cost_usd += buy_cost_usd
 
                                 # 取引履歴に記録
-                                trade_history.append({
+                                _append_trade(trade_columns, {
                                     'date': trade_date,
                                     'vote_date': vote_date,
                                     'stock_code': stock_code,
-                                    'stock_name': get_stock_name(stock_code),
+                                    'stock_name': stock_names.get(stock_code) or get_stock_name(stock_code),
                                     'action': '購入',
                                     'shares': shares_to_buy,
                                     'price': price,
@@ -880,144 +1415,101 @@ def simulate_investment(start_date, end_date, initial_jpy, initial_usd, jpy_allo
                                 temp_usd_portfolio[stock_code] = target_shares
                             else:
                                 # 現金が足りない場合は、購入できる分だけ購入
-                                available_shares = int((usd_cash * 0.99) / (price * (1 + TRADING_COSTS['commission_rate'] + TRADING_COSTS['slippage_rate'] + TRADING_COSTS['spread_rate'])))
+                                available_shares = int((usd_cash * 0.99) / (price * (1 + TOTAL_COST_RATE)))
                                 if available_shares > 0:
                                     shares_to_buy = available_shares
                                     buy_value_usd = shares_to_buy * price
-                                    buy_cost_usd = calculate_trading_cost(buy_value_usd)
+                                    buy_cost_usd = buy_value_usd * TOTAL_COST_RATE
                                     total_cost_usd = buy_value_usd + buy_cost_usd
 
-                                    if total_cost_usd <= usd_cash:
-                                        usd_cash -= total_cost_usd
-                                        usd_cash_for_purchases += total_cost_usd
-                                        total_trading_cost += buy_cost_usd * exchange_rate  # 円換算
-
-                                        # 取引履歴に記録
-                                        trade_history.append({
-                                            'date': trade_date,
-                                            'vote_date': vote_date,
-                                            'stock_code': stock_code,
-                                            'stock_name': get_stock_name(stock_code),
-                                            'action': '購入',
-                                            'shares': shares_to_buy,
-                                            'price': price,
-                                            'value': buy_value_usd,  # ドル建て
-                                            'currency': 'USD',
-                                            'exchange_rate': exchange_rate,
-                                            'buy_price': price,
-                                            'sell_price': None
-                                        })
-
-                                        # 一時ポートフォリオを更新
-                                        temp_usd_portfolio[stock_code] = current_shares + shares_to_buy
+                                    # 現金の99%以内で株数を切り捨てているため、コスト込みでも現金を超えない
+                                    usd_cash -= total_cost_usd
+                                    usd_cash_for_purchases += total_cost_usd
+                                    total_trading_cost_usd += buy_cost_usd
+
+                                    # 取引履歴に記録
+                                    _append_trade(trade_columns, {
+                                        'date': trade_date,
+                                        'vote_date': vote_date,
+                                        'stock_code': stock_code,
+                                        'stock_name': stock_names.get(stock_code) or get_stock_name(stock_code),
+                                        'action': '購入',
+                                        'shares': shares_to_buy,
+                                        'price': price,
+                                        'value': buy_value_usd,  # ドル建て
+                                        'currency': 'USD',
+                                        'exchange_rate': exchange_rate,
+                                        'buy_price': price,
+                                        'sell_price': None
+                                    })
+
+                                    # 一時ポートフォリオを更新
+                                    temp_usd_portfolio[stock_code] = current_shares + shares_to_buy
 
                 # 米国株ポートフォリオを更新
-                usd_portfolio = temp_usd_portfolio.copy()
-
-        # 毎日の終値でポートフォリオ価値を計算して記録
-        # 当日の終値を取得
-        daily_jpy_prices = {}
-        daily_usd_prices = {}
-
-        # 日本株の終値を取得
-        for stock_code in jpy_portfolio.keys():
-            price = get_stock_price_cached(stock_code, current_date.strftime("%Y-%m-%d"))
-            if price is not None:
-                daily_jpy_prices[stock_code] = price
-
-        # 米国株の終値を取得
-        for stock_code in usd_portfolio.keys():
-            price = get_stock_price_cached(stock_code, current_date.strftime("%Y-%m-%d"))
-            if price is not None:
-                daily_usd_prices[stock_code] = price
-
-        # 終値でのポートフォリオ価値を計算（円換算）
-        daily_jpy_portfolio_value = calculate_portfolio_value(jpy_portfolio, daily_jpy_prices)
-        daily_usd_portfolio_value = calculate_portfolio_value(usd_portfolio, daily_usd_prices, exchange_rate)
+                usd_portfolio = temp_usd_portfolio
 
-        # 当日の総資産価値を計算（すべて円換算）
-        daily_total_value = daily_jpy_portfolio_value + jpy_cash + daily_usd_portfolio_value + (usd_cash * exchange_rate if exchange_rate else 0)
-
-        # 日次損益率を計算
-        daily_pnl_rate = 0
-
-        # 前日終値との比較（取引日も含む）
-        # 取引日の場合は、取引による影響（実現損益など）も含まれる
-        if previous_total_value > 0:
-            daily_pnl_rate = ((daily_total_value - previous_total_value) / previous_total_value) * 100
+                # 米国株の取引コストを円換算して合計に加える
+                total_trading_cost += total_trading_cost_usd * exchange_rate
 
         # 結果を記録
+        # 終値でのポートフォリオ価値・総資産・日次損益率は、期間終了後に全日分をまとめて計算する
         simulation_results.append({
             'date': current_date,
             'vote_date': vote_date if is_trade_day else None,
-            'jpy_portfolio': jpy_portfolio.copy(),
-            'usd_portfolio': usd_portfolio.copy(),
+            'jpy_portfolio': jpy_portfolio,  # 取引日以外は前日と同じ辞書を共有
+            'usd_portfolio': usd_portfolio,
             'jpy_cash': jpy_cash,  # 円
             'usd_cash': usd_cash,  # ドル
-            'total_value': daily_total_value,  # 円換算の総資産
+            'total_value': None,  # 円換算の総資産
             'exchange_rate': exchange_rate,
-            'jpy_portfolio_value': daily_jpy_portfolio_value,  # 円
-            'usd_portfolio_value': daily_usd_portfolio_value,  # 円換算
+            'jpy_portfolio_value': None,  # 円
+            'usd_portfolio_value': None,  # 円換算
             'trading_cost': total_trading_cost if is_trade_day else 0,  # 円換算
-            'daily_pnl_rate': daily_pnl_rate,  # 日次損益率
+            'daily_pnl_rate': None,  # 日次損益率
             'is_trade_day': is_trade_day  # 取引日フラグ
         })
+        valuation_date_strs.append(current_date_str)
 
-        # 次の日のために前日の総資産価値を更新
-        previous_total_value = daily_total_value
-
-        current_date += timedelta(days=1)
+    # 毎日の終値でポートフォリオ価値を計算して記録（保有状況×終値の行列でまとめて計算）
+    fill_daily_values(simulation_results, valuation_date_strs, initial_total_value)
     
     # プログレスバーを完了状態にする
     progress_bar.progress(1.0)
     final_days = (end_date - start_date).days + 1
-    status_text.text(f"完了: {end_date.strftime('%Y-%m-%d')} ({final_days}/{total_days}日, 100%)")
+    status_text.text(f"完了: {end_date_str} ({final_days}/{total_days}日, 100%)")
     
+    trade_history = pd.DataFrame(trade_columns, columns=TRADE_HISTORY_COLUMNS)
     return simulation_results, trade_history
 
-@st.cache_data(max_entries=20, ttl=3600)
-def calculate_monthly_pnl(simulation_results, year, month):
+def calculate_monthly_pnl(results_frame, year, month):
     """
     指定月の月次損益を計算
 
     Parameters:
-    simulation_results (list): シミュレーション結果
+    results_frame (pd.DataFrame): create_results_frameの戻り値（日付順）
     year (int): 年
     month (int): 月
 
     Returns:
     dict: {'pnl_rate': 損益率, 'pnl_amount': 損益額} または None
     """
-    # 指定月のデータをフィルタリング
-    month_data = []
-    for result in simulation_results:
-        if result['date'].year == year and result['date'].month == month:
-            month_data.append(result)
+    # 日付順に並んでいるため、指定月の範囲は二分探索で求める
+    month_start = pd.Timestamp(year, month, 1)
+    start_idx, end_idx = results_frame['date'].searchsorted(
+        [month_start, month_start + pd.offsets.MonthBegin(1)]
+    )
 
-    if not month_data:
+    if start_idx == end_idx:
         return None
 
-    # 日付でソート
-    month_data.sort(key=lambda x: x['date'])
+    total_values = results_frame['total_value'].to_numpy()
 
     # 月末の価値を取得
-    end_value = month_data[-1]['total_value']
-
-    # 月初の価値を取得（前月末の価値、なければ月初の1日前の想定値）
-    # シミュレーション結果全体から前月末の価値を探す
-    start_value = None
-    month_start_date = month_data[0]['date']
-
-    # 前日の価値を探す
-    for result in simulation_results:
-        if result['date'] < month_start_date:
-            start_value = result['total_value']
-        else:
-            break
+    end_value = float(total_values[end_idx - 1])
 
-    # 前日の価値が見つからない場合は、月初の最初の日の価値を使用
-    if start_value is None:
-        start_value = month_data[0]['total_value']
+    # 月初の価値を取得（前月末の価値、なければ月初の最初の日の価値）
+    start_value = float(total_values[start_idx - 1] if start_idx > 0 else total_values[start_idx])
 
     # 損益率と損益額を計算
     if start_value > 0:
@@ -1030,14 +1522,37 @@ def calculate_monthly_pnl(simulation_results, year, month):
 
     return None
 
-def create_calendar_heatmap(simulation_results, trade_history, year, month):
+# 損益カレンダーのdarkモード対応のスタイル（Streamlitのテーマに合わせる）
+CALENDAR_TABLE_STYLE = """
+    <style>
+        table.calendar-table {
+            border-collapse: collapse;
+            width: 100%;
+            background-color: transparent;
+            color: inherit;
+        }
+        table.calendar-table th {
+            background-color: transparent;
+            color: inherit;
+            padding: 8px;
+            border: 1px solid rgba(250, 250, 250, 0.2);
+        }
+        table.calendar-table td {
+            background-color: transparent;
+            color: inherit;
+        }
+    </style>
+    """
+
+def create_calendar_heatmap(simulation_results, results_frame, trade_history, year, month):
     """カレンダー形式のヒートマップを作成（実現損益 + 含み損益）"""
 
-    # 指定月のデータをフィルタリング
-    month_data = []
-    for result in simulation_results:
-        if result['date'].year == year and result['date'].month == month:
-            month_data.append(result)
+    # 指定月のデータを抽出（結果は日付順でresults_frameと同じ並びのため、範囲は二分探索で求める）
+    month_start = pd.Timestamp(year, month, 1)
+    start_idx, end_idx = results_frame['date'].searchsorted(
+        [month_start, month_start + pd.offsets.MonthBegin(1)]
+    )
+    month_data = simulation_results[start_idx:end_idx]
 
     if not month_data:
         return None, []
@@ -1045,9 +1560,6 @@ def create_calendar_heatmap(simulation_results, trade_history, year, month):
     # カレンダーを作成
     cal = calendar.monthcalendar(year, month)
 
-    # データを日付でソート
-    month_data.sort(key=lambda x: x['date'])
-
     # calculate_pnl_breakdownを使用して損益を計算
     pnl_breakdown = calculate_pnl_breakdown(simulation_results, trade_history)
     
@@ -1075,7 +1587,7 @@ def create_calendar_heatmap(simulation_results, trade_history, year, month):
     title = f"{year}年{month}月"
 
     # 月次損益を計算
-    monthly_pnl = calculate_monthly_pnl(simulation_results, year, month)
+    monthly_pnl = calculate_monthly_pnl(results_frame, year, month)
 
     # 月次損益情報を追加
     if monthly_pnl:
@@ -1108,38 +1620,19 @@ def create_calendar_heatmap(simulation_results, trade_history, year, month):
             "</span>"
         )
 
-    html = f"<h3>{title}</h3>"
-    # darkモード対応のスタイルを追加（Streamlitのテーマに合わせる）
-    html += """
-    <style>
-        table.calendar-table {
-            border-collapse: collapse;
-            width: 100%;
-            background-color: transparent;
-            color: inherit;
-        }
-        table.calendar-table th {
-            background-color: transparent;
-            color: inherit;
-            padding: 8px;
-            border: 1px solid rgba(250, 250, 250, 0.2);
-        }
-        table.calendar-table td {
-            background-color: transparent;
-            color: inherit;
-        }
-    </style>
-    """
-    html += "<table class='calendar-table' style='border-collapse: collapse; width: 100%;'>"
+    # HTMLは部品をリストに集めて最後に1回だけ結合する
+    parts = [f"<h3>{title}</h3>"]
+    parts.append(CALENDAR_TABLE_STYLE)
+    parts.append("<table class='calendar-table' style='border-collapse: collapse; width: 100%;'>")
 
     # 曜日のヘッダー
-    html += "<tr><th>月</th><th>火</th><th>水</th><th>木</th><th>金</th><th>土</th><th>日</th></tr>"
+    parts.append("<tr><th>月</th><th>火</th><th>水</th><th>木</th><th>金</th><th>土</th><th>日</th></tr>")
 
     for week in cal:
-        html += "<tr>"
+        parts.append("<tr>")
         for day in week:
             if day == 0:
-                html += "<td></td>"
+                parts.append("<td></td>")
             else:
                 if day in daily_pnl_data:
                     data = daily_pnl_data[day]
@@ -1161,24 +1654,27 @@ def create_calendar_heatmap(simulation_results, trade_history, year, month):
                     realized_color = "blue" if realized_pnl >= 0 else "red"
                     unrealized_color = "blue" if unrealized_pnl >= 0 else "red"
                     rate_color = "blue" if daily_pnl_rate >= 0 else "red"
-                    
-                    display_text = f"<strong style='font-size: 14px;'>{day}</strong><br/>"
-                    display_text += f"<small style='color: {total_color};'>合計: {total_pnl/10000:+,.0f}万</small><br/>"
-                    display_text += f"<small style='color: {realized_color};'>実: {realized_pnl/10000:+,.0f}万</small><br/>"
-                    display_text += f"<small style='color: {unrealized_color};'>含: {unrealized_pnl/10000:+,.0f}万</small><br/>"
 
-                    # 損益率を追加（色付き）
+                    # 損益率（色付き）
                     rate_sign = "+" if daily_pnl_rate >= 0 else ""
-                    display_text += f"<small style='color: {rate_color}; font-weight: bold;'>{rate_sign}{daily_pnl_rate:.2f}%</small>"
+
+                    display_text = (
+                        f"<strong style='font-size: 14px;'>{day}</strong><br/>"
+                        f"<small style='color: {total_color};'>合計: {total_pnl/10000:+,.0f}万</small><br/>"
+                        f"<small style='color: {realized_color};'>実: {realized_pnl/10000:+,.0f}万</small><br/>"
+                        f"<small style='color: {unrealized_color};'>含: {unrealized_pnl/10000:+,.0f}万</small><br/>"
+                        f"<small style='color: {rate_color}; font-weight: bold;'>{rate_sign}{daily_pnl_rate:.2f}%</small>"
+                    )
 
                     # darkモード対応の背景色（透明にしてStreamlitのテーマに合わせる）
-                    html += f"<td style='background-color: transparent; text-align: center; padding: 5px; border: {border_width}px solid {border_color};' title='{tooltip}'>{display_text}</td>"
+                    parts.append(f"<td style='background-color: transparent; text-align: center; padding: 5px; border: {border_width}px solid {border_color};' title='{tooltip}'>{display_text}</td>")
                 else:
-                    html += f"<td style='background-color: transparent; text-align: center; padding: 5px; border: 2px solid rgba(128, 128, 128, 0.6);'>{day}</td>"
-        html += "</tr>"
+                    parts.append(f"<td style='background-color: transparent; text-align: center; padding: 5px; border: 2px solid rgba(128, 128, 128, 0.6);'>{day}</td>")
+        parts.append("</tr>")
 
-    html += "</table>"
-    html += "<p style='font-size: 12px; color: inherit;'>※ 合計=実現損益+含み損益の日次変化、実=実現損益の日次変化、含=含み損益の日次変化（単位：万円、直前の営業日との差分）、損益率=日次損益率（%）</p>"
+    parts.append("</table>")
+    parts.append("<p style='font-size: 12px; color: inherit;'>※ 合計=実現損益+含み損益の日次変化、実=実現損益の日次変化、含=含み損益の日次変化（単位：万円、直前の営業日との差分）、損益率=日次損益率（%）</p>")
+    html = "".join(parts)
 
     # グラフ用のデータを準備
     chart_data = []
@@ -1190,13 +1686,52 @@ def create_calendar_heatmap(simulation_results, trade_history, year, month):
 
     return html, chart_data
 
-@st.cache_data(max_entries=20, ttl=3600)
-def create_yearly_summary(simulation_results, year):
+def create_monthly_pnl_chart(chart_data, year, month):
+    """月別表示の日次損益の棒グラフを作成（chart_dataはcreate_calendar_heatmapの戻り値）"""
+    # 1ヶ月分の日付を生成（データがない日も含める）
+    days_in_month = calendar.monthrange(year, month)[1]
+    all_days = pd.RangeIndex(1, days_in_month + 1, name='day')
+
+    # 全日のデータを作成（データがない日は0、万円単位）
+    daily_pnl = pd.DataFrame(chart_data, columns=['day', 'total_pnl']).set_index('day')['total_pnl'].astype(np.float64)
+    chart_df = (daily_pnl.reindex(all_days, fill_value=0) / 10000).rename('total_pnl_man').reset_index()
+
+    fig = px.bar(
+        chart_df,
+        x='day',
+        y='total_pnl_man',
+        title=f"{year}年{month}月 日次損益推移",
+        labels={'total_pnl_man': '損益額（万円）', 'day': '日付'},
+        color='total_pnl_man',
+        color_continuous_scale=['red', 'white', 'blue'],
+        color_continuous_midpoint=0
+    )
+    fig.update_layout(
+        height=400,
+        showlegend=False,
+        xaxis_title="日付",
+        yaxis_title="損益額（万円）",
+        xaxis=dict(
+            tickmode='linear',
+            tick0=1,
+            dtick=1,
+            range=[0.5, days_in_month + 0.5]
+        )
+    )
+    # ホバー時の表示をカスタマイズ（小数点以下1桁、四捨五入）
+    fig.update_traces(
+        marker_line_width=0,
+        hovertemplate='日付: %{x}日<br>損益額: %{y:.1f}万円<extra></extra>'
+    )
+
+    return fig
+
+def create_yearly_summary(results_frame, year):
     """
     指定年の月別損益サマリーを作成
 
     Parameters:
-    simulation_results (list): シミュレーション結果
+    results_frame (pd.DataFrame): create_results_frameの戻り値
     year (int): 年
 
     Returns:
@@ -1205,7 +1740,7 @@ def create_yearly_summary(simulation_results, year):
     monthly_data = []
 
     for month in range(1, 13):
-        monthly_pnl = calculate_monthly_pnl(simulation_results, year, month)
+        monthly_pnl = calculate_monthly_pnl(results_frame, year, month)
 
         if monthly_pnl:
             pnl_rate = monthly_pnl['pnl_rate']
@@ -1235,31 +1770,102 @@ def create_yearly_summary(simulation_results, year):
 
     return df
 
-def calculate_risk_metrics(simulation_results):
-    """リスク指標を計算"""
-    if len(simulation_results) < 2:
+@st.cache_data(max_entries=20, ttl=3600, show_spinner=False)
+def encode_csv_shift_jis(df):
+    """
+    DataFrameをShift-JISのCSVバイト列に変換
+    文字列を経由せずBytesIOへ直接エンコードし、同じ表の再描画時はキャッシュを返す。
+    """
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, encoding='shift-jis', errors='replace')
+    return buf.getvalue()
+
+def format_result_dates(simulation_results):
+    """シミュレーション結果の日付を'%Y-%m-%d'形式の文字列配列に一括変換"""
+    return pd.to_datetime([result['date'] for result in simulation_results]).strftime('%Y-%m-%d').to_numpy()
+
+# シミュレーション結果のうち、列として持つスカラー項目
+RESULTS_FRAME_COLUMNS = [
+    'date', 'vote_date', 'total_value', 'jpy_portfolio_value', 'usd_portfolio_value',
+    'jpy_cash', 'usd_cash', 'exchange_rate', 'trading_cost'
+]
+
+def create_results_frame(simulation_results):
+    """
+    シミュレーション結果（辞書のリスト）を列単位のDataFrameに変換
+
+    集計・グラフ・表の作成で結果リストを何度も走査しないよう、シミュレーション完了時に一度だけ作成する。
+    日付はdatetime64、金額と為替レートはfloat64とし、保有銘柄は銘柄数の列として持つ。
+    """
+    records = pd.DataFrame.from_records(simulation_results, columns=RESULTS_FRAME_COLUMNS)
+    frame = records.astype({column: np.float64 for column in RESULTS_FRAME_COLUMNS[2:]})
+    frame['date'] = pd.to_datetime(records['date'])
+    frame['vote_date'] = pd.to_datetime(records['vote_date'])
+    frame['jpy_holdings'] = [len(result['jpy_portfolio']) for result in simulation_results]
+    frame['usd_holdings'] = [len(result['usd_portfolio']) for result in simulation_results]
+    return frame
+
+def get_results_signature(simulation_results, run_id):
+    """
+    シミュレーション結果を識別する軽量なキーを作成
+
+    結果リスト全体をst.cache_dataでハッシュすると日数に比例して遅くなるため、
+    実行ごとに採番したIDと、件数・期間・初日と最終日の総資産価値の組で識別する。
+    （期間と総資産価値が同じでも配分や取引が異なる実行があるため、実行IDを必ず含める）
+    """
+    if not simulation_results:
+        return (run_id, 0)
+    first, last = simulation_results[0], simulation_results[-1]
+    return (run_id, len(simulation_results), first['date'], last['date'], first['total_value'], last['total_value'])
+
+@st.cache_data(max_entries=20, ttl=3600, show_spinner=False)
+def get_risk_metrics_cached(results_signature, _results_frame):
+    """calculate_risk_metricsのキャッシュ版（結果はresults_signatureで識別）"""
+    return calculate_risk_metrics(_results_frame)
+
+@st.cache_data(max_entries=20, ttl=3600, show_spinner=False)
+def get_performance_chart_cached(results_signature, _results_frame, initial_investment):
+    """create_performance_chartのキャッシュ版（結果はresults_signatureで識別）"""
+    return create_performance_chart(_results_frame, initial_investment)
+
+@st.cache_data(max_entries=20, ttl=3600, show_spinner=False)
+def get_results_table_cached(results_signature, _results_frame):
+    """create_results_tableのキャッシュ版（結果はresults_signatureで識別）"""
+    return create_results_table(_results_frame)
+
+@st.cache_data(max_entries=100, ttl=3600, show_spinner=False)
+def get_calendar_heatmap_cached(results_signature, _simulation_results, _results_frame, _trade_history, year, month):
+    """create_calendar_heatmapのキャッシュ版（結果はresults_signatureと年月で識別）"""
+    return create_calendar_heatmap(_simulation_results, _results_frame, _trade_history, year, month)
+
+@st.cache_data(max_entries=100, ttl=3600, show_spinner=False)
+def get_monthly_pnl_chart_cached(results_signature, _chart_data, year, month):
+    """create_monthly_pnl_chartのキャッシュ版（結果はresults_signatureと年月で識別）"""
+    return create_monthly_pnl_chart(_chart_data, year, month)
+
+@st.cache_data(max_entries=20, ttl=3600, show_spinner=False)
+def get_yearly_summary_cached(results_signature, _results_frame, year):
+    """create_yearly_summaryのキャッシュ版（結果はresults_signatureと年で識別）"""
+    return create_yearly_summary(_results_frame, year)
+
+def calculate_risk_metrics(results_frame):
+    """リスク指標を計算（results_frameはcreate_results_frameの戻り値）"""
+    if len(results_frame) < 2:
         return {}
     
-    values = [result['total_value'] for result in simulation_results]
+    values = results_frame['total_value'].to_numpy()
     
-    # 日次リターンを計算
-    daily_returns = []
-    for i in range(1, len(values)):
-        if values[i-1] > 0:
-            daily_return = (values[i] - values[i-1]) / values[i-1]
-            # 極端に大きな日次リターンを制限（±50%）
-            if daily_return > 0.5:
-                daily_return = 0.5
-            elif daily_return < -0.5:
-                daily_return = -0.5
-            daily_returns.append(daily_return)
+    # 日次リターンを計算（前日価値が正の日のみ、極端な値は±50%に制限）
+    prev_values = values[:-1]
+    valid = prev_values > 0
+    daily_returns = np.clip(np.diff(values)[valid] / prev_values[valid], -0.5, 0.5)
     
-    if not daily_returns:
+    if daily_returns.size == 0:
         return {}
     
     # 年率リターン
     total_return = (values[-1] - values[0]) / values[0] if values[0] > 0 else 0
-    days = len(simulation_results)
+    days = len(results_frame)
     
     # オーバーフローを防ぐため、極端に大きなリターンの場合は制限
     if total_return > 10:  # 1000%を超える場合は制限
@@ -1267,11 +1873,9 @@ def calculate_risk_metrics(simulation_results):
     elif total_return < -0.9:  # -90%を下回る場合は制限
         total_return = -0.9
     
-    try:
-        annual_return = (1 + total_return) ** (365 / days) - 1 if days > 0 else 0
-    except OverflowError:
-        # オーバーフローが発生した場合は安全な値を使用
-        annual_return = 10 if total_return > 0 else -0.9
+    # リターンは[-90%, 1000%]に制限済みで日数は2以上のため、年率換算はオーバーフローしない
+    # （最大でも11の182.5乗程度で、floatの範囲に収まる）
+    annual_return = (1 + total_return) ** (365 / days) - 1
     
     # 年率ボラティリティ
     daily_volatility = np.std(daily_returns)
@@ -1280,38 +1884,93 @@ def calculate_risk_metrics(simulation_results):
     # シャープレシオ
     sharpe_ratio = (annual_return - RISK_FREE_RATE) / annual_volatility if annual_volatility > 0 else 0
     
-    # 最大ドローダウン
-    peak = values[0]
-    max_drawdown = 0
-    for value in values:
-        if value > peak:
-            peak = value
-        drawdown = (peak - value) / peak
-        max_drawdown = max(max_drawdown, drawdown)
+    # 最大ドローダウン（ピークが0以下の期間はドローダウンを0とする）
+    peak = np.maximum.accumulate(values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = np.where(peak > 0, (peak - values) / peak, 0.0)
+    max_drawdown = max(float(drawdowns.max()), 0)
+    
+    # 最大ドローダウンの期間（直前のピークから底までの日数）
+    # ピーク値が続く期間（運用開始前の横ばいなど）は、その最後の日をピークとする
+    trough_idx = int(drawdowns.argmax())
+    peak_idx = trough_idx - int(values[trough_idx::-1].argmax())
+    dates = results_frame['date']
+    max_drawdown_days = (dates.iat[trough_idx] - dates.iat[peak_idx]).days
     
     return {
         'annual_return': annual_return * 100,
         'annual_volatility': annual_volatility * 100,
         'sharpe_ratio': sharpe_ratio,
         'max_drawdown': max_drawdown * 100,
-        'total_trades': len(simulation_results)
+        'max_drawdown_days': max_drawdown_days,
+        'total_trades': len(results_frame)
     }
 
-def create_performance_chart(simulation_results, initial_investment):
-    """パフォーマンス推移チャートを作成"""
-    if not simulation_results:
+# ポートフォリオ変更履歴の表示書式（データは数値のまま保持し、表示時のみ適用する）
+RESULTS_TABLE_FORMAT = {
+    'ポートフォリオ価値': '¥{:,.0f}',
+    '日本株価値': '¥{:,.0f}',
+    '米国株価値': '¥{:,.0f}',
+    '日本株現金': '¥{:,.0f}',
+    '米国株現金': '${:,.2f}',
+    '為替レート': '{:.2f}',
+    '取引コスト': '¥{:,.0f}'
+}
+
+def create_results_table(results_frame):
+    """ポートフォリオ変更履歴のデータフレームを作成（金額は数値のまま列単位で作成）"""
+    exchange_rate = results_frame['exchange_rate']
+
+    return pd.DataFrame({
+        '取引日': results_frame['date'].dt.strftime('%Y-%m-%d'),
+        '投票日': results_frame['vote_date'].dt.strftime('%Y-%m-%d').fillna('-'),
+        'ポートフォリオ価値': results_frame['total_value'],
+        '日本株価値': results_frame['jpy_portfolio_value'],
+        '米国株価値': results_frame['usd_portfolio_value'],
+        '日本株現金': results_frame['jpy_cash'],
+        '米国株現金': results_frame['usd_cash'],
+        '為替レート': exchange_rate.where(exchange_rate != 0),
+        '取引コスト': results_frame['trading_cost'],
+        '日本株銘柄数': results_frame['jpy_holdings'],
+        '米国株銘柄数': results_frame['usd_holdings']
+    })
+
+# ポートフォリオ詳細の表示書式（日本株・米国株）
+JPY_HOLDINGS_FORMAT = {'保有株数': '{:.2f}', '現在価格': '¥{:.2f}', '評価額': '¥{:,.0f}'}
+USD_HOLDINGS_FORMAT = {'保有株数': '{:.2f}', '現在価格': '${:.2f}', '評価額': '¥{:,.0f}'}
+
+def create_holdings_table(portfolio, prices, exchange_rate=1.0):
+    """保有銘柄のデータフレームを列単位で作成（評価額は円換算、価格が無い銘柄は0とする）"""
+    codes = list(portfolio)
+    shares = np.fromiter(portfolio.values(), dtype=np.float64, count=len(codes))
+    current_prices = pd.Series(prices, dtype=np.float64).reindex(codes).fillna(0.0).to_numpy()
+
+    return pd.DataFrame({
+        '銘柄コード': codes,
+        '銘柄名': [get_stock_name(code) for code in codes],
+        '保有株数': shares,
+        '現在価格': current_prices,
+        '評価額': shares * current_prices * exchange_rate
+    })
+
+def create_performance_chart(results_frame, initial_investment):
+    """パフォーマンス推移チャートを作成（results_frameはcreate_results_frameの戻り値）"""
+    if results_frame.empty:
         return None
 
     # シミュレーション結果のデータを取得
-    dates = [result['date'] for result in simulation_results]
-    values = [result['total_value'] for result in simulation_results]
+    dates = results_frame['date']
+    values = results_frame['total_value'].to_numpy()
 
     # 万単位に変換
-    values_in_man = [value / 10000 for value in values]
+    values_in_man = values / 10000
     initial_investment_in_man = initial_investment / 10000
 
     # 初期投資額からの変化率を計算
-    returns = [((value - initial_investment) / initial_investment) * 100 if initial_investment > 0 else 0 for value in values]
+    if initial_investment > 0:
+        returns = ((values - initial_investment) / initial_investment) * 100
+    else:
+        returns = np.zeros_like(values)
 
     fig = make_subplots(
         rows=2, cols=1,
@@ -1319,16 +1978,16 @@ def create_performance_chart(simulation_results, initial_investment):
         vertical_spacing=0.1
     )
 
-    # ポートフォリオ価値のチャート（万単位）
+    # ポートフォリオ価値のチャート（万単位、日数が多くても軽く描画できるようWebGLで描画）
     fig.add_trace(
-        go.Scatter(x=dates, y=values_in_man, mode='lines', name='ポートフォリオ価値', line=dict(color='blue')),
+        go.Scattergl(x=dates, y=values_in_man, mode='lines', name='ポートフォリオ価値', line=dict(color='blue')),
         row=1, col=1
     )
 
     # 初期投資額の水平線を追加
     fig.add_trace(
         go.Scatter(
-            x=[dates[0], dates[-1]],
+            x=[dates.iloc[0], dates.iloc[-1]],
             y=[initial_investment_in_man, initial_investment_in_man],
             mode='lines',
             name='初期投資額',
@@ -1339,14 +1998,14 @@ def create_performance_chart(simulation_results, initial_investment):
 
     # 累積リターンのチャート
     fig.add_trace(
-        go.Scatter(x=dates, y=returns, mode='lines', name='累積リターン(%)', line=dict(color='green')),
+        go.Scattergl(x=dates, y=returns, mode='lines', name='累積リターン(%)', line=dict(color='green')),
         row=2, col=1
     )
 
     # 0%の水平線を追加（リターンチャート用）
     fig.add_trace(
         go.Scatter(
-            x=[dates[0], dates[-1]],
+            x=[dates.iloc[0], dates.iloc[-1]],
             y=[0, 0],
             mode='lines',
             name='0%ライン',
@@ -1368,91 +2027,270 @@ def create_performance_chart(simulation_results, initial_investment):
 
     return fig
 
-def show(selected_date):
-    # 株価キャッシュテーブルを初期化
-    init_price_cache_table()
-
-    st.title("投資シミュレーション")
-
-    # 設定パネル
+@st.fragment
+def show_simulation_settings():
+    """シミュレーション設定パネルを表示（入力値は各ウィジェットのkeyでsession_stateに保持される）"""
     with st.expander("シミュレーション設定", expanded=True):
         # 1行目: 開始日、終了日
         col1_row1, col2_row1 = st.columns(2)
         with col1_row1:
-            start_date = st.date_input(
+            st.date_input(
                 "開始日",
                 value=date(2025, 7, 1),
                 min_value=date(2020, 1, 1),
-                max_value=datetime.now().date()
+                max_value=datetime.now().date(),
+                key="sim_start_date"
             )
         with col2_row1:
-            end_date = st.date_input(
+            st.date_input(
                 "終了日",
                 value=datetime.now().date(),
                 min_value=date(2020, 1, 1),
-                max_value=datetime.now().date()
+                max_value=datetime.now().date(),
+                key="sim_end_date"
             )
         
         # 2行目: 日本株初期資金、米国株初期資金
         col1_row2, col2_row2 = st.columns(2)
         with col1_row2:
-            initial_jpy = st.number_input(
+            st.number_input(
                 "日本株初期資金 (円)",
                 value=5000000,
                 min_value=0,
-                step=100000
+                step=100000,
+                key="sim_initial_jpy"
             )
         with col2_row2:
-            initial_usd = st.number_input(
+            st.number_input(
                 "米国株初期資金 (円)",
                 value=5000000,
                 min_value=0,
-                step=100000
+                step=100000,
+                key="sim_initial_usd"
             )
         
-        # 3行目以降: 投資配分比率
+        # 3行目以降: 投資配分比率（順位×日本株・米国株の表を1つの入力表で編集する）
         st.write("**投資配分比率 (%)**")
-        jpy_allocation_ratios = []
-        usd_allocation_ratios = []
-        
-        for i in range(10):
-            col1, col2 = st.columns(2)
-            with col1:
-                jpy_ratio = st.number_input(
-                    f"日本株第{i+1}位",
-                    value=DEFAULT_ALLOCATION[i],
-                    min_value=0,
-                    max_value=100,
-                    step=1,
-                    key=f"jpy_allocation_{i}"
-                )
-                jpy_allocation_ratios.append(jpy_ratio)
-            
-            with col2:
-                usd_ratio = st.number_input(
-                    f"米国株第{i+1}位",
-                    value=DEFAULT_ALLOCATION[i],
-                    min_value=0,
-                    max_value=100,
-                    step=1,
-                    key=f"usd_allocation_{i}"
-                )
-                usd_allocation_ratios.append(usd_ratio)
+        allocation_df = pd.DataFrame(
+            {'日本株': DEFAULT_ALLOCATION, '米国株': DEFAULT_ALLOCATION},
+            index=[f"第{i+1}位" for i in range(len(DEFAULT_ALLOCATION))]
+        )
+        edited_allocation = st.data_editor(
+            allocation_df,
+            num_rows="fixed",
+            use_container_width=True,
+            column_config={
+                column: st.column_config.NumberColumn(column, min_value=0, max_value=100, step=1, format="%d")
+                for column in allocation_df.columns
+            },
+            key="allocation_editor"
+        )
+        # 空欄にされたセルは0%として扱う
+        edited_allocation = edited_allocation.fillna(0).astype(int)
+        st.session_state.sim_allocation = edited_allocation
         
         # 配分の合計を表示
-        jpy_total_allocation = sum(jpy_allocation_ratios)
-        usd_total_allocation = sum(usd_allocation_ratios)
+        jpy_total_allocation, usd_total_allocation = edited_allocation[['日本株', '米国株']].sum().tolist()
         
         if jpy_total_allocation != 100:
             st.warning(f"日本株配分の合計が100%ではありません（現在: {jpy_total_allocation}%）")
         if usd_total_allocation != 100:
             st.warning(f"米国株配分の合計が100%ではありません（現在: {usd_total_allocation}%）")
+
+def shift_calendar_month(months, min_year, max_year):
+    """
+    損益カレンダーの表示月を前後に移動（前月・次月ボタンのコールバック）
+    ボタンより前に描画される年・月の選択にも反映されるよう、再実行の前に呼ばれるコールバックで更新する。
+    """
+    st.session_state.selected_month_monthly += months
+    if st.session_state.selected_month_monthly < 1:
+        st.session_state.selected_month_monthly = 12
+        st.session_state.selected_year_monthly -= 1
+        if st.session_state.selected_year_monthly < min_year:
+            st.session_state.selected_year_monthly = min_year
+            st.session_state.selected_month_monthly = 1
+    elif st.session_state.selected_month_monthly > 12:
+        st.session_state.selected_month_monthly = 1
+        st.session_state.selected_year_monthly += 1
+        if st.session_state.selected_year_monthly > max_year:
+            st.session_state.selected_year_monthly = max_year
+            st.session_state.selected_month_monthly = 12
+
+@st.fragment
+def show_pnl_calendar(simulation_results, results_frame, results_signature):
+    """損益カレンダー（月別・年間表示）を表示"""
+    st.subheader("損益カレンダー")
+
+    # 表示モード選択
+    display_mode = st.radio("表示モード", ["月別表示", "年間表示"], horizontal=True)
+
+    # 年の選択
+    if simulation_results:
+        # シミュレーション結果は日付順に並んでいるため両端だけを見ればよい
+        min_year = results_frame['date'].iloc[0].year
+        max_year = results_frame['date'].iloc[-1].year
+
+        if display_mode == "月別表示":
+            # 月別表示モード
+            # 前月・次月のナビゲーション
+            # 初期表示を終了日の年・月にする
+            if 'selected_year_monthly' not in st.session_state or 'selected_month_monthly' not in st.session_state:
+                # 終了日（最後のシミュレーション結果の日付）の年・月を取得
+                if simulation_results:
+                    end_date_result = simulation_results[-1]['date']
+                    st.session_state.selected_year_monthly = end_date_result.year
+                    st.session_state.selected_month_monthly = end_date_result.month
+                else:
+                    st.session_state.selected_year_monthly = max_year
+                    st.session_state.selected_month_monthly = 12
+            
+            col1, col2, col3, col4 = st.columns([1, 2, 2, 1])
+            
+            # 前月ボタン
+            with col1:
+                st.button("◀", key="prev_month", help="前月", on_click=shift_calendar_month, args=(-1, min_year, max_year))
+            
+            # 年選択
+            with col2:
+                year_index = list(range(min_year, max_year + 1)).index(st.session_state.selected_year_monthly) if st.session_state.selected_year_monthly in range(min_year, max_year + 1) else max_year - min_year
+                selected_year = st.selectbox("年", range(min_year, max_year + 1), index=year_index)
+                if selected_year != st.session_state.selected_year_monthly:
+                    st.session_state.selected_year_monthly = selected_year
+            
+            # 月選択
+            with col3:
+                month_index = st.session_state.selected_month_monthly - 1 if 1 <= st.session_state.selected_month_monthly <= 12 else 11
+                selected_month = st.selectbox("月", range(1, 13), index=month_index)
+                if selected_month != st.session_state.selected_month_monthly:
+                    st.session_state.selected_month_monthly = selected_month
+            
+            # 次月ボタン
+            with col4:
+                st.button("▶", key="next_month", help="次月", on_click=shift_calendar_month, args=(1, min_year, max_year))
+            
+            # session_stateから値を取得（ボタン・選択で変更された場合に反映）
+            selected_year = st.session_state.selected_year_monthly
+            selected_month = st.session_state.selected_month_monthly
+
+            # カレンダーを表示
+            result = get_calendar_heatmap_cached(results_signature, simulation_results, results_frame, st.session_state.trade_history, selected_year, selected_month)
+            if result:
+                calendar_html, chart_data = result
+                st.markdown(calendar_html, unsafe_allow_html=True)
+                
+                # 棒グラフを表示
+                fig = get_monthly_pnl_chart_cached(results_signature, chart_data, selected_year, selected_month)
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("選択された月のデータがありません。")
+
+        else:
+            # 年間表示モード
+            selected_year = st.selectbox("年", range(min_year, max_year + 1), index=max_year - min_year, key="year_yearly")
+
+            # 年間サマリーを作成
+            yearly_df = get_yearly_summary_cached(results_signature, results_frame, selected_year)
+
+            if not yearly_df.empty:
+                # 表示用のDataFrameを作成（ソート用カラムを除外）
+                display_df = yearly_df[['月', '損益率', '損益額（円）']].copy()
+
+                # DataFrameのスタイリング関数
+                def style_yearly_summary(df):
+                    # 損益率の符号から色を一括で決め、月列以外に適用する
+                    def color_cells(data):
+                        pnl_rate_values = yearly_df.loc[data.index, '_pnl_rate_value'].to_numpy()
+                        colors = np.select(
+                            [pnl_rate_values > 0, pnl_rate_values < 0],
+                            ['color: blue', 'color: red'],
+                            default='color: black'
+                        )
+                        styles = pd.DataFrame('', index=data.index, columns=data.columns)
+                        styles[['損益率', '損益額（円）']] = np.repeat(colors[:, None], 2, axis=1)
+                        return styles
+
+                    return df.style.apply(color_cells, axis=None)
+
+                # スタイル付きのDataFrameを表示
+                st.dataframe(style_yearly_summary(display_df), use_container_width=True, height=500)
+
+                # 年間合計を計算
+                total_pnl_amount = yearly_df['_pnl_amount_value'].sum()
+                total_pnl_amount_str = f"+{total_pnl_amount:,.0f}" if total_pnl_amount >= 0 else f"{total_pnl_amount:,.0f}"
+
+                st.info(f"**{selected_year}年 年間合計損益額: {total_pnl_amount_str}円**")
+                
+                # 棒グラフを表示
+                chart_df = yearly_df.copy()
+                chart_df['month_num'] = range(1, 13)
+                chart_df['date'] = pd.to_datetime(f"{selected_year}-" + chart_df['month_num'].astype(str) + "-01")
+                chart_df['_pnl_amount_value_man'] = chart_df['_pnl_amount_value'] / 10000  # 万円単位に変換
+                
+                fig = px.bar(
+                    chart_df,
+                    x='date',
+                    y='_pnl_amount_value_man',
+                    title=f"{selected_year}年 月別損益推移",
+                    labels={'_pnl_amount_value_man': '損益額（万円）', 'date': '月'},
+                    color='_pnl_amount_value_man',
+                    color_continuous_scale=['red', 'white', 'blue'],
+                    color_continuous_midpoint=0
+                )
+                fig.update_layout(
+                    height=400,
+                    showlegend=False,
+                    xaxis_title="月",
+                    yaxis_title="損益額（万円）",
+                    xaxis=dict(
+                        tickmode='array',
+                        tickvals=chart_df['date'],
+                        ticktext=[f"{i}月" for i in range(1, 13)]
+                    )
+                )
+                # ホバー時の表示をカスタマイズ（小数点以下1桁、四捨五入）
+                fig.update_traces(
+                    marker_line_width=0,
+                    hovertemplate='月: %{x}<br>損益額: %{y:.1f}万円<extra></extra>'
+                )
+                st.plotly_chart(fig, use_container_width=True)
+            else:
+                st.info("選択された年のデータがありません。")
+
+def show(selected_date):
+    # 株価キャッシュテーブルを初期化
+    init_price_cache_table()
+
+    st.title("投資シミュレーション")
+
+    # 設定パネル（入力値の変更ではパネルだけを再実行し、値はsession_stateから読み出す）
+    show_simulation_settings()
+    start_date = st.session_state.sim_start_date
+    end_date = st.session_state.sim_end_date
+    initial_jpy = st.session_state.sim_initial_jpy
+    initial_usd = st.session_state.sim_initial_usd
+    jpy_allocation_ratios = st.session_state.sim_allocation['日本株'].tolist()
+    usd_allocation_ratios = st.session_state.sim_allocation['米国株'].tolist()
     
     # シミュレーション実行ボタン
     if st.button("シミュレーション実行", type="primary"):
+        # 実行条件（同じ条件での再実行は前回の結果を再利用する）
+        simulation_params = (
+            start_date,
+            end_date,
+            initial_jpy,
+            initial_usd,
+            tuple(jpy_allocation_ratios),
+            tuple(usd_allocation_ratios)
+        )
+
         # 日付の妥当性チェック
         if start_date > end_date:
             st.error("開始日は終了日より前である必要があります。")
+        elif (
+            st.session_state.get('simulation_params') == simulation_params
+            and st.session_state.get('simulation_results')
+        ):
+            st.success("同じ条件のシミュレーション結果を表示しています。")
         else:
             with st.spinner("シミュレーションを実行中..."):
                 try:
@@ -1467,7 +2305,11 @@ def show(selected_date):
 
                     if simulation_results:
                         st.session_state.simulation_results = simulation_results
+                        st.session_state.simulation_df = create_results_frame(simulation_results)
                         st.session_state.trade_history = trade_history
+                        st.session_state.simulation_params = simulation_params
+                        # 実行ごとに一意なID（キャッシュ済みの集計・グラフを他の実行と取り違えないため）
+                        st.session_state.simulation_run_id = uuid.uuid4().hex
                         st.success("シミュレーションが完了しました！")
                     else:
                         st.warning("シミュレーション対象のデータが見つかりませんでした。")
@@ -1477,6 +2319,10 @@ def show(selected_date):
     # 結果表示
     if 'simulation_results' in st.session_state and st.session_state.simulation_results:
         simulation_results = st.session_state.simulation_results
+        # 集計・グラフ・表は列単位のDataFrameから作成する
+        results_frame = st.session_state.get('simulation_df')
+        if results_frame is None or len(results_frame) != len(simulation_results):
+            results_frame = st.session_state.simulation_df = create_results_frame(simulation_results)
         
         # サマリー情報
         st.subheader("シミュレーション結果サマリー")
@@ -1485,8 +2331,13 @@ def show(selected_date):
         final_value = simulation_results[-1]['total_value'] if simulation_results else initial_value
         total_return = ((final_value - initial_value) / initial_value) * 100 if initial_value > 0 else 0
         
+        # 結果の識別キー（再実行時の集計・グラフ作成をキャッシュから取得するため）
+        results_signature = get_results_signature(
+            simulation_results, st.session_state.get('simulation_run_id')
+        )
+        
         # リスク指標を計算
-        risk_metrics = calculate_risk_metrics(simulation_results)
+        risk_metrics = get_risk_metrics_cached(results_signature, results_frame)
         
         col1, col2, col3, col4 = st.columns(4)
         with col1:
@@ -1510,390 +2361,99 @@ def show(selected_date):
                 st.metric("シャープレシオ", f"{risk_metrics['sharpe_ratio']:.2f}")
             with col4:
                 st.metric("最大ドローダウン", f"{risk_metrics['max_drawdown']:.2f}%")
+                st.caption(f"ピークから底まで {risk_metrics['max_drawdown_days']}日")
         
         # パフォーマンスチャート
         st.subheader("パフォーマンス推移")
-        fig = create_performance_chart(simulation_results, initial_value)
+        fig = get_performance_chart_cached(results_signature, results_frame, initial_value)
         if fig:
             st.plotly_chart(fig, use_container_width=True)
         
-        # カレンダー表示
-        st.subheader("損益カレンダー")
-
-        # 表示モード選択
-        display_mode = st.radio("表示モード", ["月別表示", "年間表示"], horizontal=True)
-
-        # 年の選択
-        if simulation_results:
-            min_year = min(result['date'].year for result in simulation_results)
-            max_year = max(result['date'].year for result in simulation_results)
-
-            if display_mode == "月別表示":
-                # 月別表示モード
-                # 前月・次月のナビゲーション
-                # 初期表示を終了日の年・月にする
-                if 'selected_year_monthly' not in st.session_state or 'selected_month_monthly' not in st.session_state:
-                    # 終了日（最後のシミュレーション結果の日付）の年・月を取得
-                    if simulation_results:
-                        end_date_result = simulation_results[-1]['date']
-                        st.session_state.selected_year_monthly = end_date_result.year
-                        st.session_state.selected_month_monthly = end_date_result.month
-                    else:
-                        st.session_state.selected_year_monthly = max_year
-                        st.session_state.selected_month_monthly = 12
-                
-                col1, col2, col3, col4 = st.columns([1, 2, 2, 1])
-                
-                # 前月ボタン
-                with col1:
-                    if st.button("◀", key="prev_month", help="前月"):
-                        st.session_state.selected_month_monthly -= 1
-                        if st.session_state.selected_month_monthly < 1:
-                            st.session_state.selected_month_monthly = 12
-                            st.session_state.selected_year_monthly -= 1
-                            if st.session_state.selected_year_monthly < min_year:
-                                st.session_state.selected_year_monthly = min_year
-                                st.session_state.selected_month_monthly = 1
-                        st.rerun()
-                
-                # 年選択
-                with col2:
-                    year_index = list(range(min_year, max_year + 1)).index(st.session_state.selected_year_monthly) if st.session_state.selected_year_monthly in range(min_year, max_year + 1) else max_year - min_year
-                    selected_year = st.selectbox("年", range(min_year, max_year + 1), index=year_index)
-                    if selected_year != st.session_state.selected_year_monthly:
-                        st.session_state.selected_year_monthly = selected_year
-                        st.rerun()
-                
-                # 月選択
-                with col3:
-                    month_index = st.session_state.selected_month_monthly - 1 if 1 <= st.session_state.selected_month_monthly <= 12 else 11
-                    selected_month = st.selectbox("月", range(1, 13), index=month_index)
-                    if selected_month != st.session_state.selected_month_monthly:
-                        st.session_state.selected_month_monthly = selected_month
-                        st.rerun()
-                
-                # 次月ボタン
-                with col4:
-                    if st.button("▶", key="next_month", help="次月"):
-                        st.session_state.selected_month_monthly += 1
-                        if st.session_state.selected_month_monthly > 12:
-                            st.session_state.selected_month_monthly = 1
-                            st.session_state.selected_year_monthly += 1
-                            if st.session_state.selected_year_monthly > max_year:
-                                st.session_state.selected_year_monthly = max_year
-                                st.session_state.selected_month_monthly = 12
-                        st.rerun()
-                
-                # session_stateから値を取得（ボタンで変更された場合に反映）
-                selected_year = st.session_state.selected_year_monthly
-                selected_month = st.session_state.selected_month_monthly
-
-                # カレンダーを表示
-                result = create_calendar_heatmap(simulation_results, st.session_state.trade_history, selected_year, selected_month)
-                if result:
-                    calendar_html, chart_data = result
-                    st.markdown(calendar_html, unsafe_allow_html=True)
-                    
-                    # 棒グラフを表示
-                    # 1ヶ月分の日付を生成（データがない日も含める）
-                    days_in_month = calendar.monthrange(selected_year, selected_month)[1]
-                    all_days = list(range(1, days_in_month + 1))
-                    
-                    # データがある日付を辞書に変換
-                    chart_dict = {}
-                    if chart_data:
-                        chart_dict = {row['day']: row['total_pnl'] / 10000 for row in chart_data}
-                    
-                    # 全日のデータを作成（データがない日は0）
-                    full_chart_data = []
-                    for day in all_days:
-                        pnl_value = chart_dict.get(day, 0)
-                        full_chart_data.append({
-                            'day': day,
-                            'total_pnl_man': pnl_value
-                        })
-                    
-                    chart_df = pd.DataFrame(full_chart_data)
-                    
-                    fig = px.bar(
-                        chart_df,
-                        x='day',
-                        y='total_pnl_man',
-                        title=f"{selected_year}年{selected_month}月 日次損益推移",
-                        labels={'total_pnl_man': '損益額（万円）', 'day': '日付'},
-                        color='total_pnl_man',
-                        color_continuous_scale=['red', 'white', 'blue'],
-                        color_continuous_midpoint=0
-                    )
-                    fig.update_layout(
-                        height=400,
-                        showlegend=False,
-                        xaxis_title="日付",
-                        yaxis_title="損益額（万円）",
-                        xaxis=dict(
-                            tickmode='linear',
-                            tick0=1,
-                            dtick=1,
-                            range=[0.5, days_in_month + 0.5]
-                        )
-                    )
-                    # ホバー時の表示をカスタマイズ（小数点以下1桁、四捨五入）
-                    fig.update_traces(
-                        marker_line_width=0,
-                        hovertemplate='日付: %{x}日<br>損益額: %{y:.1f}万円<extra></extra>'
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                else:
-                    st.info("選択された月のデータがありません。")
-
-            else:
-                # 年間表示モード
-                selected_year = st.selectbox("年", range(min_year, max_year + 1), index=max_year - min_year, key="year_yearly")
-
-                # 年間サマリーを作成
-                yearly_df = create_yearly_summary(simulation_results, selected_year)
-
-                if not yearly_df.empty:
-                    # 表示用のDataFrameを作成（ソート用カラムを除外）
-                    display_df = yearly_df[['月', '損益率', '損益額（円）']].copy()
-
-                    # DataFrameのスタイリング関数
-                    def style_yearly_summary(df):
-                        def color_cells(row):
-                            # 対応する行のインデックスを取得
-                            idx = row.name
-                            pnl_rate_value = yearly_df.loc[idx, '_pnl_rate_value']
-
-                            # 色を決定
-                            if pnl_rate_value > 0:
-                                color = 'blue'
-                            elif pnl_rate_value < 0:
-                                color = 'red'
-                            else:
-                                color = 'black'
-
-                            # 各セルにスタイルを適用
-                            return [''] + [f'color: {color}'] * 2  # 月列以外に色を適用
-
-                        return df.style.apply(color_cells, axis=1)
-
-                    # スタイル付きのDataFrameを表示
-                    st.dataframe(style_yearly_summary(display_df), use_container_width=True, height=500)
-
-                    # 年間合計を計算
-                    total_pnl_amount = yearly_df['_pnl_amount_value'].sum()
-                    total_pnl_amount_str = f"+{total_pnl_amount:,.0f}" if total_pnl_amount >= 0 else f"{total_pnl_amount:,.0f}"
-
-                    st.info(f"**{selected_year}年 年間合計損益額: {total_pnl_amount_str}円**")
-                    
-                    # 棒グラフを表示
-                    chart_df = yearly_df.copy()
-                    chart_df['month_num'] = range(1, 13)
-                    chart_df['date'] = pd.to_datetime(f"{selected_year}-" + chart_df['month_num'].astype(str) + "-01")
-                    chart_df['_pnl_amount_value_man'] = chart_df['_pnl_amount_value'] / 10000  # 万円単位に変換
-                    
-                    fig = px.bar(
-                        chart_df,
-                        x='date',
-                        y='_pnl_amount_value_man',
-                        title=f"{selected_year}年 月別損益推移",
-                        labels={'_pnl_amount_value_man': '損益額（万円）', 'date': '月'},
-                        color='_pnl_amount_value_man',
-                        color_continuous_scale=['red', 'white', 'blue'],
-                        color_continuous_midpoint=0
-                    )
-                    fig.update_layout(
-                        height=400,
-                        showlegend=False,
-                        xaxis_title="月",
-                        yaxis_title="損益額（万円）",
-                        xaxis=dict(
-                            tickmode='array',
-                            tickvals=chart_df['date'],
-                            ticktext=[f"{i}月" for i in range(1, 13)]
-                        )
-                    )
-                    # ホバー時の表示をカスタマイズ（小数点以下1桁、四捨五入）
-                    fig.update_traces(
-                        marker_line_width=0,
-                        hovertemplate='月: %{x}<br>損益額: %{y:.1f}万円<extra></extra>'
-                    )
-                    st.plotly_chart(fig, use_container_width=True)
-                else:
-                    st.info("選択された年のデータがありません。")
+        # カレンダー表示（年月の切り替えではカレンダー部分だけを再実行する）
+        show_pnl_calendar(simulation_results, results_frame, results_signature)
         
         # ポートフォリオ詳細表示
         st.subheader("ポートフォリオ詳細")
         
         if simulation_results:
             latest_result = simulation_results[-1]
+            latest_date_str = latest_result['date'].strftime('%Y-%m-%d')
+            
+            # 保有銘柄の株価は日本株・米国株まとめて1回で取得する
+            latest_prices = get_stock_prices_concurrent(
+                list(latest_result['jpy_portfolio']) + list(latest_result['usd_portfolio']),
+                latest_date_str
+            )
             
             col1, col2 = st.columns(2)
             
             with col1:
                 st.write("**日本株ポートフォリオ**")
                 if latest_result['jpy_portfolio']:
-                    jpy_df = pd.DataFrame([
-                        {
-                            '銘柄コード': stock_code,
-                            '銘柄名': get_stock_name(stock_code),
-                            '保有株数': f"{shares:.2f}",
-                            '現在価格': f"¥{get_stock_price_cached(stock_code, latest_result['date'].strftime('%Y-%m-%d')) or 0:.2f}",
-                            '評価額': f"¥{shares * (get_stock_price_cached(stock_code, latest_result['date'].strftime('%Y-%m-%d')) or 0):,.0f}"
-                        }
-                        for stock_code, shares in latest_result['jpy_portfolio'].items()
-                    ])
-                    st.dataframe(jpy_df, use_container_width=True)
+                    jpy_df = create_holdings_table(latest_result['jpy_portfolio'], latest_prices)
+                    st.dataframe(jpy_df.style.format(JPY_HOLDINGS_FORMAT), use_container_width=True)
                 else:
                     st.info("日本株の保有はありません")
             
             with col2:
                 st.write("**米国株ポートフォリオ**")
                 if latest_result['usd_portfolio']:
-                    usd_df = pd.DataFrame([
-                        {
-                            '銘柄コード': stock_code,
-                            '銘柄名': get_stock_name(stock_code),
-                            '保有株数': f"{shares:.2f}",
-                            '現在価格': f"${get_stock_price_cached(stock_code, latest_result['date'].strftime('%Y-%m-%d')) or 0:.2f}",
-                            '評価額': f"¥{shares * (get_stock_price_cached(stock_code, latest_result['date'].strftime('%Y-%m-%d')) or 0) * (latest_result['exchange_rate'] or 1):,.0f}"
-                        }
-                        for stock_code, shares in latest_result['usd_portfolio'].items()
-                    ])
-                    st.dataframe(usd_df, use_container_width=True)
+                    usd_df = create_holdings_table(
+                        latest_result['usd_portfolio'], latest_prices, latest_result['exchange_rate'] or 1
+                    )
+                    st.dataframe(usd_df.style.format(USD_HOLDINGS_FORMAT), use_container_width=True)
                 else:
                     st.info("米国株の保有はありません")
         
         # 取引履歴の詳細表示
+        # 以下の詳細テーブルは表示を選んだときだけ計算・描画し、他のウィジェット操作時の再実行を軽くする
         st.subheader("取引履歴詳細")
-        
-        if 'trade_history' in st.session_state and st.session_state.trade_history:
+        show_trade_detail = st.checkbox("取引履歴詳細を表示", key="show_trade_detail")
+        if show_trade_detail and 'trade_history' in st.session_state and not st.session_state.trade_history.empty:
             trade_history = st.session_state.trade_history
             
-            # 取引履歴を銘柄ごとに整理して損益を計算
-            trade_summary = {}
-            for trade in trade_history:
-                stock_code = trade['stock_code']
-                if stock_code not in trade_summary:
-                    trade_summary[stock_code] = {
-                        'stock_name': trade['stock_name'],
-                        'currency': trade['currency'],
-                        'buy_trades': [],
-                        'sell_trades': []
-                    }
-                
-                if trade['action'] == '購入':
-                    trade_summary[stock_code]['buy_trades'].append(trade)
-                else:
-                    trade_summary[stock_code]['sell_trades'].append(trade)
-            
             # 銘柄毎の損益を計算（平均取得単価法を使用）
-            detailed_trades = []
-            for stock_code, summary in trade_summary.items():
-                # 購入と売却を時系列でソート
-                buy_trades = sorted(summary['buy_trades'], key=lambda x: x['date'])
-                sell_trades = sorted(summary['sell_trades'], key=lambda x: x['date'])
-                
-                # 平均取得単価法で損益を計算
-                # 保有状況を追跡
-                holding = {'shares': 0, 'total_cost': 0}
-                
-                # 全取引を時系列で処理
-                all_trades = []
-                for trade in buy_trades:
-                    all_trades.append(('buy', trade))
-                for trade in sell_trades:
-                    all_trades.append(('sell', trade))
-                all_trades.sort(key=lambda x: x[1]['date'])
-                
-                for trade_type, trade in all_trades:
-                    if trade_type == 'buy':
-                        # 購入：株数と総コストを加算
-                        holding['shares'] += trade['shares']
-                        cost = trade['price'] * trade['shares']
-                        if trade['currency'] == 'USD' and trade.get('exchange_rate'):
-                            cost *= trade['exchange_rate']
-                        holding['total_cost'] += cost
-                    
-                    elif trade_type == 'sell':
-                        if holding['shares'] > 0:
-                            # 平均取得単価を計算
-                            avg_cost_per_share = holding['total_cost'] / holding['shares']
-                            
-                            # 売却額を計算
-                            sell_value = trade['price'] * trade['shares']
-                            if trade['currency'] == 'USD' and trade.get('exchange_rate'):
-                                sell_value_jpy = sell_value * trade['exchange_rate']
-                            else:
-                                sell_value_jpy = sell_value
-                            
-                            # 実現損益を計算（円ベース）
-                            cost_basis = avg_cost_per_share * trade['shares']
-                            pnl_amount_jpy = sell_value_jpy - cost_basis
-                            
-                            # 元の通貨での損益額と損益率
-                            if trade['currency'] == 'USD':
-                                pnl_amount = pnl_amount_jpy / trade['exchange_rate'] if trade.get('exchange_rate') else 0
-                                avg_cost_usd = avg_cost_per_share / trade['exchange_rate'] if trade.get('exchange_rate') else 0
-                                pnl_rate = ((trade['price'] - avg_cost_usd) / avg_cost_usd) * 100 if avg_cost_usd > 0 else 0
-                            else:
-                                pnl_amount = pnl_amount_jpy
-                                pnl_rate = ((trade['price'] - avg_cost_per_share) / avg_cost_per_share) * 100 if avg_cost_per_share > 0 else 0
-                            
-                            detailed_trades.append({
-                                '購入日': '複数' if len([t for t in buy_trades if t['date'] <= trade['date']]) > 1 else buy_trades[0]['date'].strftime('%Y-%m-%d'),
-                                '売却日': trade['date'].strftime('%Y-%m-%d'),
-                                '銘柄コード': stock_code,
-                                '銘柄名': summary['stock_name'],
-                                '通貨': trade['currency'],
-                                '株数': trade['shares'],
-                                '平均取得単価': round(avg_cost_per_share / trade['exchange_rate'], 2) if trade['currency'] == 'USD' and trade.get('exchange_rate') else round(avg_cost_per_share, 2),
-                                '売却価格': trade['price'],
-                                '損益額': round(pnl_amount, 2),
-                                '損益率(%)': round(pnl_rate, 2),
-                                '損益額(円)': round(pnl_amount_jpy, 0)
-                            })
-                            
-                            # 保有状況を更新（比例配分で減少）
-                            sell_ratio = trade['shares'] / holding['shares']
-                            holding['shares'] -= trade['shares']
-                            holding['total_cost'] *= (1 - sell_ratio)
+            df_trades = calculate_trade_pnl_details(trade_history)
             
-            if detailed_trades:
-                df_trades = pd.DataFrame(detailed_trades)
-                
+            if not df_trades.empty:
                 # 損益額でソート
                 df_trades = df_trades.sort_values('損益額(円)', ascending=False)
                 
                 # スタイリング
                 def style_pnl(df):
-                    def color_row(row):
-                        color = 'red' if row['損益率(%)'] < 0 else 'blue'
-                        return [f'color: {color}'] * len(row)
-                    return df.style.apply(color_row, axis=1)
+                    # 行ごとの関数呼び出しを避け、損益率の符号から全セルのスタイルを一括で作る
+                    def color_all(data):
+                        colors = np.where(data['損益率(%)'].to_numpy() < 0, 'color: red', 'color: blue')
+                        return pd.DataFrame(
+                            np.repeat(colors[:, None], data.shape[1], axis=1),
+                            index=data.index,
+                            columns=data.columns,
+                        )
+                    return df.style.apply(color_all, axis=None).format(TRADE_DETAIL_FORMAT)
                 
                 st.dataframe(style_pnl(df_trades), use_container_width=True)
                 
-                # CSVダウンロード
-                csv = df_trades.to_csv(index=False).encode('shift-jis', errors='replace')
+                # CSVダウンロード（CSVはボタンのクリック時にのみ生成する）
                 st.download_button(
                     label="取引履歴詳細をCSVダウンロード",
-                    data=csv,
+                    data=partial(encode_csv_shift_jis, df_trades),
                     file_name=f"trade_history_detail_{start_date.strftime('%Y%m%d')}.csv",
                     mime='text/csv',
                 )
                 
                 # 統計情報
                 st.subheader("取引統計")
+                # 損益率の符号を一度だけ求め、勝ち・負けの件数に使い回す
+                pnl_sign = np.sign(df_trades['損益率(%)'].to_numpy())
                 col1, col2, col3, col4 = st.columns(4)
                 with col1:
                     total_trades = len(df_trades)
                     st.metric("総取引回数", total_trades)
                 with col2:
-                    winning_trades = len(df_trades[df_trades['損益率(%)'] > 0])
+                    winning_trades = int((pnl_sign > 0).sum())
                     st.metric("勝ちトレード", winning_trades)
                 with col3:
-                    losing_trades = len(df_trades[df_trades['損益率(%)'] < 0])
+                    losing_trades = int((pnl_sign < 0).sum())
                     st.metric("負けトレード", losing_trades)
                 with col4:
                     win_rate = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
@@ -1903,83 +2463,67 @@ def show(selected_date):
         
         # 詳細データテーブル
         st.subheader("ポートフォリオ変更履歴")
+        if st.checkbox("ポートフォリオ変更履歴を表示", key="show_results_table"):
+            # データフレームを作成
+            df = get_results_table_cached(results_signature, results_frame)
+            st.dataframe(df.style.format(RESULTS_TABLE_FORMAT, na_rep='N/A'), use_container_width=True)
         
-        # データフレームを作成
-        df_data = []
-        for result in simulation_results:
-            df_data.append({
-                '取引日': result['date'].strftime('%Y-%m-%d'),
-                '投票日': result['vote_date'].strftime('%Y-%m-%d') if result['vote_date'] else '-',
-                'ポートフォリオ価値': f"¥{result['total_value']:,.0f}",
-                '日本株価値': f"¥{result['jpy_portfolio_value']:,.0f}",
-                '米国株価値': f"¥{result['usd_portfolio_value']:,.0f}",
-                '日本株現金': f"¥{result['jpy_cash']:,.0f}",
-                '米国株現金': f"${result['usd_cash']:,.2f}",
-                '為替レート': f"{result['exchange_rate']:.2f}" if result['exchange_rate'] else "N/A",
-                '取引コスト': f"¥{result['trading_cost']:,.0f}",
-                '日本株銘柄数': len(result['jpy_portfolio']),
-                '米国株銘柄数': len(result['usd_portfolio'])
-            })
-        
-        df = pd.DataFrame(df_data)
-        st.dataframe(df, use_container_width=True)
-        
-        # CSVダウンロード
-        csv = df.to_csv(index=False).encode('shift-jis', errors='replace')
-        st.download_button(
-            label="シミュレーション結果をCSVダウンロード",
-            data=csv,
-            file_name=f"investment_simulation_{start_date.strftime('%Y%m%d')}.csv",
-            mime='text/csv',
-        )
+            # CSVダウンロード（CSVはボタンのクリック時にのみ生成する）
+            st.download_button(
+                label="シミュレーション結果をCSVダウンロード",
+                data=partial(encode_csv_shift_jis, df),
+                file_name=f"investment_simulation_{start_date.strftime('%Y%m%d')}.csv",
+                mime='text/csv',
+            )
 
         # 損益詳細テーブル
         st.subheader("損益詳細")
-
-        # calculate_pnl_breakdownを使用して損益詳細データを取得
-        pnl_breakdown = calculate_pnl_breakdown(simulation_results, st.session_state.trade_history)
+        if st.checkbox("損益詳細を表示", key="show_pnl_detail"):
+            # calculate_pnl_breakdownを使用して損益詳細データを取得
+            pnl_breakdown = calculate_pnl_breakdown(simulation_results, st.session_state.trade_history)
         
-        pnl_detail_data = []
-        for result in simulation_results:
-            result_date = result['date']
-            date_str = result_date.strftime('%Y-%m-%d')
+            # 日付・曜日・ポートフォリオ価値はresults_frameの列から取り出す
+            weekday_names = np.array(['月', '火', '水', '木', '金', '土', '日'])
+            detail_dates = results_frame['date']
             
-            if result_date in pnl_breakdown:
-                pnl_data = pnl_breakdown[result_date]
-                
-                # 実現損益詳細を整形
-                realized_trades_str = []
-                for detail in pnl_data.get('realized_detail', []):
-                    realized_trades_str.append(f"{detail['stock_code']}:{detail['pnl']/10000:.1f}万")
+            pnl_detail_data = []
+            for result, date_str, weekday, total_value in zip(
+                simulation_results,
+                detail_dates.dt.strftime('%Y-%m-%d'),
+                weekday_names[detail_dates.dt.weekday.to_numpy()],
+                results_frame['total_value'].tolist()
+            ):
+                result_date = result['date']
+            
+                if result_date in pnl_breakdown:
+                    pnl_data = pnl_breakdown[result_date]
                 
-                # 含み損益詳細を整形
-                unrealized_holdings_str = []
-                for detail in pnl_data.get('unrealized_detail', []):
-                    unrealized_holdings_str.append(f"{detail['stock_code']}:{detail['pnl']/10000:.1f}万")
+                    # 実現損益・含み損益の詳細を「銘柄コード:損益（万円）」の'|'区切りに整形
+                    realized_trades_str = format_pnl_details(pnl_data.get('realized_detail', []))
+                    unrealized_holdings_str = format_pnl_details(pnl_data.get('unrealized_detail', []))
                 
-                pnl_detail_data.append({
-                    '日付': date_str,
-                    '曜日': ['月', '火', '水', '木', '金', '土', '日'][result_date.weekday()],
-                    '合計損益（万円）': f"{pnl_data['total_pnl']/10000:+,.1f}",
-                    '実現損益（万円）': f"{pnl_data['realized_pnl']/10000:+,.1f}",
-                    '含み損益（万円）': f"{pnl_data['unrealized_pnl']/10000:+,.1f}",
-                    '日次損益率（%）': f"{pnl_data.get('daily_pnl_rate', 0):.2f}",
-                    'ポートフォリオ価値（万円）': f"{result['total_value']/10000:,.1f}",
-                    '実現損益詳細': '|'.join(realized_trades_str) if realized_trades_str else '-',
-                    '含み損益詳細': '|'.join(unrealized_holdings_str) if unrealized_holdings_str else '-'
-                })
+                    pnl_detail_data.append({
+                        '日付': date_str,
+                        '曜日': weekday,
+                        '合計損益（万円）': round(pnl_data['total_pnl'] / 10000, 1),
+                        '実現損益（万円）': round(pnl_data['realized_pnl'] / 10000, 1),
+                        '含み損益（万円）': round(pnl_data['unrealized_pnl'] / 10000, 1),
+                        '日次損益率（%）': round(pnl_data.get('daily_pnl_rate', 0), 2),
+                        'ポートフォリオ価値（万円）': round(total_value / 10000, 1),
+                        '実現損益詳細': realized_trades_str,
+                        '含み損益詳細': unrealized_holdings_str
+                    })
         
-        pnl_df = pd.DataFrame(pnl_detail_data)
-        st.dataframe(pnl_df, use_container_width=True)
-
-        # 損益詳細CSVダウンロード
-        pnl_csv = pnl_df.to_csv(index=False).encode('shift-jis', errors='replace')
-        st.download_button(
-            label="損益詳細をCSVダウンロード",
-            data=pnl_csv,
-            file_name=f"pnl_detail_{start_date.strftime('%Y%m%d')}.csv",
-            mime='text/csv',
-        )
+            pnl_df = pd.DataFrame(pnl_detail_data)
+            st.dataframe(pnl_df.style.format(PNL_DETAIL_FORMAT), use_container_width=True)
+
+            # 損益詳細CSVダウンロード（CSVはボタンのクリック時にのみ生成する）
+            st.download_button(
+                label="損益詳細をCSVダウンロード",
+                data=partial(encode_csv_shift_jis, pnl_df),
+                file_name=f"pnl_detail_{start_date.strftime('%Y%m%d')}.csv",
+                mime='text/csv',
+            )
 
 @st.cache_data(max_entries=20, ttl=3600)
 def calculate_pnl_breakdown(simulation_results, trade_history):
@@ -1989,7 +2533,7 @@ def calculate_pnl_breakdown(simulation_results, trade_history):
     
     Args:
         simulation_results (list): シミュレーション結果のリスト
-        trade_history (list): 取引履歴のリスト
+        trade_history (pd.DataFrame): 取引履歴（simulate_investmentの戻り値）
         
     Returns:
         dict: {date_obj: {
@@ -2001,106 +2545,267 @@ def calculate_pnl_breakdown(simulation_results, trade_history):
             'daily_pnl_rate': float
         }}
     """
-    daily_pnl_data = {}
-    
     # 日付順にソート
     sorted_results = sorted(simulation_results, key=lambda x: x['date'])
-    sorted_trades = sorted(trade_history, key=lambda x: x['date'])
+    sorted_trades = list(trade_history.sort_values('date', kind='stable').itertuples(index=False))
     
     # 状態管理用変数
     holdings = {} # {stock_code: {'shares': 0, 'total_cost': 0, 'currency': 'JPY'/'USD'}}
     cumulative_realized_pnl = 0
     
-    # 前日の累積値を保持
-    prev_realized_pnl = 0
-    prev_unrealized_pnl = 0
-    
     trade_idx = 0
     
+    # 日付文字列は一括で整形しておく（行ごとのstrftimeを避ける）
+    date_strs = format_result_dates(sorted_results)
+    
+    # 日ごとの保有状況と累積実現損益（1回目の走査で取引を反映しながら記録する）
+    held_snapshots = []
+    cumulative_realized = []
+    realized_details = []
+    
     for result in sorted_results:
         date_current = result['date']
-        date_str = date_current.strftime('%Y-%m-%d')
         
         realized_detail = []
         
         # 当日（またはそれ以前）の取引を処理
-        while trade_idx < len(sorted_trades) and sorted_trades[trade_idx]['date'] <= date_current:
+        while trade_idx < len(sorted_trades) and sorted_trades[trade_idx].date <= date_current:
             trade = sorted_trades[trade_idx]
-            stock_code = trade['stock_code']
+            stock_code = trade.stock_code
             
-            if stock_code not in holdings:
-                holdings[stock_code] = {'shares': 0, 'total_cost': 0, 'currency': trade['currency']}
+            holding = holdings.get(stock_code)
+            if holding is None:
+                holding = holdings[stock_code] = {'shares': 0, 'total_cost': 0, 'currency': trade.currency}
             
-            if trade['action'] == '購入':
+            if trade.action == '購入':
                 # 平均取得単価の計算のためにコストを加算
-                holdings[stock_code]['shares'] += trade['shares']
-                cost = trade['price'] * trade['shares']
-                if trade['currency'] == 'USD' and trade.get('exchange_rate'):
-                    cost *= trade['exchange_rate']
-                holdings[stock_code]['total_cost'] += cost
+                holding['shares'] += trade.shares
+                cost = trade.price * trade.shares
+                if trade.currency == 'USD' and trade.exchange_rate:
+                    cost *= trade.exchange_rate
+                holding['total_cost'] += cost
                 
-            elif trade['action'] == '売却':
-                if holdings[stock_code]['shares'] > 0:
+            elif trade.action == '売却':
+                if holding['shares'] > 0:
                     # 平均取得単価を計算
-                    avg_cost = holdings[stock_code]['total_cost'] / holdings[stock_code]['shares']
+                    avg_cost = holding['total_cost'] / holding['shares']
                     
                     # 実現損益を計算: (売却額 - 平均コスト * 売却株数)
-                    sell_value = trade['price'] * trade['shares']
-                    if trade['currency'] == 'USD' and trade.get('exchange_rate'):
-                        sell_value *= trade['exchange_rate']
+                    sell_value = trade.price * trade.shares
+                    if trade.currency == 'USD' and trade.exchange_rate:
+                        sell_value *= trade.exchange_rate
                     
-                    pnl = sell_value - (avg_cost * trade['shares'])
+                    pnl = sell_value - (avg_cost * trade.shares)
                     cumulative_realized_pnl += pnl
                     
                     # 詳細を記録
-                    if trade['date'] == date_current:
+                    if trade.date == date_current:
                         realized_detail.append({
                             'stock_code': stock_code,
                             'pnl': pnl
                         })
                     
                     # 保有状況を更新（比例配分で減少）
-                    sell_ratio = trade['shares'] / holdings[stock_code]['shares']
-                    holdings[stock_code]['shares'] -= trade['shares']
-                    holdings[stock_code]['total_cost'] *= (1 - sell_ratio)
+                    sell_ratio = trade.shares / holding['shares']
+                    holding['shares'] -= trade.shares
+                    holding['total_cost'] *= (1 - sell_ratio)
             
             trade_idx += 1
             
+        # 当日の保有状況を記録（含み損益は全日分の株価をまとめて取得してから計算する）
+        held_snapshots.append([
+            (stock_code, holding['shares'], holding['total_cost'], holding['currency'])
+            for stock_code, holding in holdings.items() if holding['shares'] > 0
+        ])
+        cumulative_realized.append(cumulative_realized_pnl)
+        realized_details.append(realized_detail)
+    
+    # 保有銘柄の終値は日付×銘柄の行列として1回で取得する（保有銘柄がない日は取得しない）
+    price_matrix = get_price_matrix(
+        [[snapshot[0] for snapshot in held] for held in held_snapshots], list(date_strs)
+    )
+    price_values = price_matrix.to_numpy().tolist()
+    column_index = {code: i for i, code in enumerate(price_matrix.columns)}
+    
+    # 日ごとの累積含み損益
+    cumulative_unrealized = []
+    unrealized_details = []
+    
+    for row, (result, held) in enumerate(zip(sorted_results, held_snapshots)):
         # 含み損益の計算
         cumulative_unrealized_pnl = 0
         unrealized_detail = []
         
-        for stock_code, holding in holdings.items():
-            if holding['shares'] > 0:
-                price = get_stock_price_cached(stock_code, date_str)
-                if price is not None and price > 0:
-                    current_value = price * holding['shares']
-                    if holding['currency'] == 'USD' and result.get('exchange_rate'):
-                        current_value *= result['exchange_rate']
-                    
-                    pnl = current_value - holding['total_cost']
-                    cumulative_unrealized_pnl += pnl
-                    
-                    unrealized_detail.append({
-                        'stock_code': stock_code,
-                        'pnl': pnl
-                    })
-        
-        # 日次変化を計算
-        daily_realized = cumulative_realized_pnl - prev_realized_pnl
-        daily_unrealized = cumulative_unrealized_pnl - prev_unrealized_pnl
-        total_change = daily_realized + daily_unrealized
+        for stock_code, shares, total_cost, currency in held:
+            price = price_values[row][column_index[stock_code]]
+            if price > 0:
+                current_value = price * shares
+                if currency == 'USD' and result.get('exchange_rate'):
+                    current_value *= result['exchange_rate']
+                
+                pnl = current_value - total_cost
+                cumulative_unrealized_pnl += pnl
+                
+                unrealized_detail.append({
+                    'stock_code': stock_code,
+                    'pnl': pnl
+                })
         
-        daily_pnl_data[date_current] = {
+        cumulative_unrealized.append(cumulative_unrealized_pnl)
+        unrealized_details.append(unrealized_detail)
+    
+    # 日次変化は累積値の差分として一括で計算する（初日は前日を0とする）
+    daily_realized = np.diff(np.array(cumulative_realized, dtype=np.float64), prepend=0.0)
+    daily_unrealized = np.diff(np.array(cumulative_unrealized, dtype=np.float64), prepend=0.0)
+    total_changes = daily_realized + daily_unrealized
+    
+    return {
+        result['date']: {
             'total_pnl': total_change,
-            'realized_pnl': daily_realized,
-            'unrealized_pnl': daily_unrealized,
+            'realized_pnl': realized,
+            'unrealized_pnl': unrealized,
             'realized_detail': realized_detail,
             'unrealized_detail': unrealized_detail,
             'daily_pnl_rate': result.get('daily_pnl_rate', 0)
         }
-        
-        prev_realized_pnl = cumulative_realized_pnl
-        prev_unrealized_pnl = cumulative_unrealized_pnl
-        
-    return daily_pnl_data
+        for result, total_change, realized, unrealized, realized_detail, unrealized_detail in zip(
+            sorted_results, total_changes.tolist(), daily_realized.tolist(), daily_unrealized.tolist(),
+            realized_details, unrealized_details
+        )
+    }
+
+# 損益詳細の表示書式（金額は万円単位の数値で保持し、CSVにも数値のまま出力する）
+PNL_DETAIL_FORMAT = {
+    '合計損益（万円）': '{:+,.1f}',
+    '実現損益（万円）': '{:+,.1f}',
+    '含み損益（万円）': '{:+,.1f}',
+    '日次損益率（%）': '{:.2f}',
+    'ポートフォリオ価値（万円）': '{:,.1f}'
+}
+
+def format_pnl_details(details):
+    """銘柄別損益の明細を「銘柄コード:損益（万円）」の'|'区切り文字列に整形（明細がなければ'-'）"""
+    return '|'.join([f"{detail['stock_code']}:{detail['pnl'] / 10000:.1f}万" for detail in details]) or '-'
+
+# 取引履歴詳細の表示書式（明細は数値のまま保持し、ソートとCSV出力は数値で行う）
+TRADE_DETAIL_FORMAT = {
+    '株数': '{:,.0f}',
+    '平均取得単価': '{:,.2f}',
+    '売却価格': '{:,.2f}',
+    '損益額': '{:+,.2f}',
+    '損益率(%)': '{:+.2f}%',
+    '損益額(円)': '{:+,.0f}'
+}
+
+def _average_cost_walk(group_ids, n_groups, is_sell, shares, values_jpy):
+    """
+    平均取得単価の逐次計算（売却時点の平均取得単価と、それまでの購入回数を返す）
+
+    取引は日付順（同日は購入→売却の順）に並んでいること。銘柄は整数ID、保有状況は
+    IDで引くリストで持ち、numpyスカラーを介さずPythonの数値で計算する。
+
+    Returns:
+        tuple: (avg_costs, buy_counts) 売却以外・保有なしの行の平均取得単価はNaN
+    """
+    n = len(group_ids)
+    avg_costs = [np.nan] * n
+    buy_counts = [0] * n
+    held_shares = [0.0] * n_groups
+    total_costs = [0.0] * n_groups
+    n_buys = [0] * n_groups
+
+    for i, (group, sell, qty, value_jpy) in enumerate(
+        zip(group_ids.tolist(), is_sell.tolist(), shares.tolist(), values_jpy.tolist())
+    ):
+        if not sell:
+            # 購入：株数と総コストを加算
+            held_shares[group] += qty
+            total_costs[group] += value_jpy
+            n_buys[group] += 1
+        elif held_shares[group] > 0:
+            avg_costs[i] = total_costs[group] / held_shares[group]
+            buy_counts[i] = n_buys[group]
+            # 保有状況を更新（比例配分で減少）
+            total_costs[group] *= (1 - qty / held_shares[group])
+            held_shares[group] -= qty
+
+    return np.array(avg_costs, dtype=np.float64), np.array(buy_counts, dtype=np.int64)
+
+def calculate_trade_pnl_details(trade_history):
+    """
+    取引履歴から売却1件ごとの実現損益の明細を計算する（平均取得単価法）
+
+    平均取得単価は保有状況に依存するため、その逐次計算のみを取引の順に行い、
+    円換算・損益額・損益率・丸め・日付の整形は列単位でまとめて計算する。
+
+    Args:
+        trade_history (pd.DataFrame): 取引履歴（simulate_investmentの戻り値）
+
+    Returns:
+        pd.DataFrame: 取引履歴詳細の表示用データ（売却がない場合は空、銘柄コード・通貨はカテゴリ型）
+    """
+    # 銘柄ごとに、日付順（同日は購入→売却の順）で全取引を処理する
+    trades = trade_history.assign(
+        is_sell=trade_history['action'] != '購入'
+    ).sort_values(['date', 'is_sell'], kind='stable')
+
+    is_sell = trades['is_sell'].to_numpy()
+    shares = trades['shares'].to_numpy(dtype=np.float64)
+    prices = trades['price'].to_numpy(dtype=np.float64)
+    exchange_rates = trades['exchange_rate'].astype(np.float64).to_numpy()
+
+    # 米国株で為替レートがある取引のみ円換算する
+    is_usd = trades['currency'].to_numpy() == 'USD'
+    has_rate = is_usd & (np.nan_to_num(exchange_rates) != 0)
+    rates = np.where(has_rate, exchange_rates, 1.0)
+    values_jpy = prices * shares * rates
+
+    # 銘柄コードは初出順の整数IDに変換して逐次計算に渡す（表示順にも使う）
+    stock_order, unique_codes = pd.factorize(trades['stock_code'])
+    avg_costs, buy_counts = _average_cost_walk(stock_order, len(unique_codes), is_sell, shares, values_jpy)
+
+    realized = ~np.isnan(avg_costs)
+    if not realized.any():
+        return pd.DataFrame()
+
+    # 表示順は銘柄の初出順、同一銘柄内は時系列
+    order = np.flatnonzero(realized)
+    order = order[np.argsort(stock_order[order], kind='stable')]
+
+    sells = trades.iloc[order]
+    avg_cost = avg_costs[order]
+    sell_shares = shares[order]
+    sell_prices = prices[order]
+    sell_rates = exchange_rates[order]
+    sell_is_usd = is_usd[order]
+    sell_has_rate = has_rate[order]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # 実現損益を計算（円ベース）
+        pnl_amount_jpy = values_jpy[order] - avg_cost * sell_shares
+
+        # 元の通貨での損益額と平均取得単価
+        avg_cost_usd = np.where(sell_has_rate, avg_cost / sell_rates, 0)
+        pnl_amount = np.where(
+            sell_is_usd, np.where(sell_has_rate, pnl_amount_jpy / sell_rates, 0), pnl_amount_jpy
+        )
+        base_cost = np.where(sell_is_usd, avg_cost_usd, avg_cost)
+        pnl_rate = np.where(base_cost > 0, ((sell_prices - base_cost) / base_cost) * 100, 0)
+
+    # 銘柄ごとの初回購入日と銘柄名を1回のgroupbyで求める（売却済み銘柄は必ず購入がある）
+    first_buys = trades.loc[~trades['is_sell']].groupby('stock_code', sort=False)[['date', 'stock_name']].first()
+    first_buy_strs = pd.to_datetime(sells['stock_code'].map(first_buys['date'])).dt.strftime('%Y-%m-%d')
+
+    return pd.DataFrame({
+        '購入日': np.where(buy_counts[order] > 1, '複数', first_buy_strs.to_numpy()),
+        '売却日': pd.to_datetime(sells['date']).dt.strftime('%Y-%m-%d').to_numpy(),
+        '銘柄コード': pd.Categorical(sells['stock_code'].to_numpy()),
+        '銘柄名': sells['stock_code'].map(first_buys['stock_name']).to_numpy(),
+        '通貨': pd.Categorical(sells['currency'].to_numpy()),
+        '株数': sells['shares'].to_numpy(),
+        '平均取得単価': np.round(np.where(sell_has_rate, avg_cost_usd, avg_cost), 2),
+        '売却価格': sell_prices,
+        '損益額': np.round(pnl_amount, 2),
+        '損益率(%)': np.round(pnl_rate, 2),
+        '損益額(円)': np.round(pnl_amount_jpy, 0)
+    })
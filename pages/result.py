@@ -1,17 +1,19 @@
 import streamlit as st
 from utils.common import format_vote_data_with_thresh
-from utils.db import get_connection
+from utils.db import get_vote_summary
 
-import csv
-from io import StringIO
 import pandas as pd
+from operator import itemgetter
 from io import BytesIO
 import platform
 import os
+from functools import lru_cache
 
+@lru_cache(maxsize=1)
 def get_font_path():
     """
     環境に応じて日本語フォントのパスを返す関数
+    実行中にフォント配置は変わらないため、結果をプロセス内でキャッシュする
     
     Returns:
     str: 日本語フォントのパス
@@ -50,39 +52,29 @@ def get_font_path():
                 return path
     return None
 
+@lru_cache(maxsize=1)
+def get_font_family():
+    """
+    日本語フォントをmatplotlibに登録し、フォントファミリー名を返す関数
+    addfontは呼ぶたびにフォント一覧へ重複して追加されるため、登録はプロセス内で1回のみ行う
+    
+    Returns:
+    str: フォントファミリー名（日本語フォントが見つからない場合は None）
+    """
+    font_path = get_font_path()
+    if font_path is None:
+        return None
+    from matplotlib import font_manager
+    font_manager.fontManager.addfont(font_path)
+    return font_manager.FontProperties(fname=font_path).get_name()
+
 def show(selected_date):
     selected_date_str = selected_date.strftime("%Y-%m-%d")
     
     st.title("投票結果確認")
     st.write(f"【対象日】{selected_date_str}")
     
-    # 投票数の合計と投票ボタンが押された回数を取得
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # 投票数の合計を取得
-    c.execute(
-        """
-        SELECT COUNT(*) as total_votes
-        FROM vote
-        WHERE vote_date = ?
-        """,
-        (selected_date_str,)
-    )
-    result = c.fetchone()
-    total_votes = result[0] if result is not None else 0
-    
-    # 投票ボタンが押された回数を取得（created_atが同じものを1回としてカウント）
-    c.execute(
-        """
-        SELECT COUNT(DISTINCT created_at) as vote_sessions
-        FROM vote
-        WHERE vote_date = ?
-        """,
-        (selected_date_str,)
-    )
-    vote_sessions_result = c.fetchone()
-    vote_sessions = vote_sessions_result[0] if vote_sessions_result is not None else 0
+    results, total_votes, vote_sessions = get_vote_summary(selected_date_str)
     
     # 投票情報を表示
     col1, col2 = st.columns(2)
@@ -91,26 +83,10 @@ def show(selected_date):
     with col2:
         st.metric("投票ボタンが押された回数", vote_sessions)
     
-    # voteテーブルから、対象日の各銘柄の投票数を集計（多い順）
-    c.execute(
-        """
-        SELECT v.stock_code, COUNT(*) as vote_count, m.stock_name
-        FROM vote v
-        LEFT JOIN stock_master m ON v.stock_code = m.stock_code
-        WHERE v.vote_date = ?
-        GROUP BY v.stock_code
-        ORDER BY vote_count DESC
-        """,
-        (selected_date_str,)
-    )
-    results = c.fetchall()
-    conn.close()
-    
     if results:
         row1_col1, row1_col2 = st.columns(2)
         # テキストファイルExportボタン
-        codes = [row[0] for row in results]
-        file_content = "\n".join(codes)
+        file_content = "\n".join(map(itemgetter(0), results))
         filename = f"投票結果{selected_date.strftime('%Y%m%d')}.txt"
         with row1_col1:
             st.download_button("銘柄コードExport", data=file_content, file_name=filename, mime="text/plain")
@@ -124,18 +100,11 @@ def show(selected_date):
         
         row2_col1, row2_col2 = st.columns(2)
         # CSVファイルExportボタン
-        csv_buffer = StringIO()
-        csv_writer = csv.writer(csv_buffer)
-        # ヘッダー行をSJISで書き込み
         headers = ['銘柄コード', '投票数', '銘柄名', 'TradingView URL']
         csv_data = [(row[0], row[1], row[2] or row[0], f'https://jp.tradingview.com/chart/?symbol={row[0]}') for row in results]
         
-        # SJISでエンコードしたバイトデータを作成
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        writer.writerows(csv_data)
-        csv_str = output.getvalue()
+        # SJISでエンコードしたバイトデータを作成（改行はcsvモジュールと同じCRLF）
+        csv_str = pd.DataFrame(csv_data, columns=headers).to_csv(index=False, lineterminator='\r\n')
         csv_bytes = csv_str.encode('shift-jis', errors='replace')
         
         csv_filename = f"投票結果{selected_date.strftime('%Y%m%d')}.csv"
@@ -165,7 +134,7 @@ def show(selected_date):
             # 列幅の自動調整
             for idx, col in enumerate(df.columns):
                 max_length = max(
-                    df[col].astype(str).apply(len).max(),
+                    df[col].astype(str).str.len().max(),
                     len(str(col))
                 )
                 worksheet.column_dimensions[chr(65 + idx)].width = max_length + 2
@@ -194,12 +163,16 @@ def show(selected_date):
         stock_name_dict = {row[2] or row[0]: row[1] for row in results}  # 銘柄名がNoneの場合は銘柄コードを使用
         try:
             from wordcloud import WordCloud
-            import matplotlib.pyplot as plt
+            # pyplotの状態管理（図の登録・バックエンドの選択）を介さず、Figureを直接生成してAggで描画する
+            # （ワードクラウドはPILで直接PNG化するため、matplotlibはランキング画像のみで使う）
+            from matplotlib.figure import Figure
+            from matplotlib import rc_context
             
-            # 投票結果をキャッシュキーとして使用
-            @st.cache_data(ttl=None)  # TTLなし（投票結果が変わるまでキャッシュ有効）
-            def generate_wordcloud(vote_data_str, date_str, use_stock_name=False):
-                vote_dict = eval(vote_data_str)  # 文字列から辞書に戻す
+            # 投票結果（ソート済みの(キー, 票数)タプル）をキャッシュキーとして使用
+            # 画像はPNGのバイト列として返し、表示とダウンロードで同じデータを使う（エンコードは1回のみ）
+            @st.cache_data(ttl=None, max_entries=40)  # TTLなし（投票結果が変わるまでキャッシュ有効）
+            def generate_wordcloud(vote_items, date_str, use_stock_name=False):
+                vote_dict = dict(vote_items)
                 # 日本語フォントのパスを取得
                 font_path = get_font_path()
                 if font_path is None:
@@ -211,22 +184,17 @@ def show(selected_date):
                     background_color='white',
                     font_path=font_path
                 ).generate_from_frequencies(vote_dict)
-                fig = plt.figure(figsize=(10, 5))
-                plt.imshow(wc, interpolation='bilinear')
-                plt.axis("off")
-                return fig
+                buf = BytesIO()
+                wc.to_image().save(buf, format="PNG")
+                return buf.getvalue()
             
             # 銘柄コードのワードクラウド
             st.subheader("銘柄コードのワードクラウド")
-            vote_data_str = str(vote_dict)
-            fig = generate_wordcloud(vote_data_str, selected_date_str, False)
-            st.pyplot(fig)
+            wordcloud_data = generate_wordcloud(tuple(sorted(vote_dict.items())), selected_date_str, False)
+            st.image(wordcloud_data, use_container_width=True)
             
             # ワードクラウド画像のダウンロードボタン
-            buf = BytesIO()
-            fig.savefig(buf, format="png", bbox_inches='tight', pad_inches=0.1)
             wordcloud_filename = f"銘柄投票{selected_date.strftime('%Y%m%d')}.png"
-            wordcloud_data = buf.getvalue()
 
             st.download_button(
                 label="銘柄コードワードクラウド画像保存",
@@ -237,19 +205,19 @@ def show(selected_date):
             
             # 銘柄名のワードクラウド
             st.subheader("銘柄名のワードクラウド")
-            stock_name_data_str = str(stock_name_dict)
-            fig = generate_wordcloud(stock_name_data_str, selected_date_str, True)
-            st.pyplot(fig)
+            st.image(
+                generate_wordcloud(tuple(sorted(stock_name_dict.items())), selected_date_str, True),
+                use_container_width=True
+            )
 
             st.markdown("---")
             
-            # ランキング画像の生成・保存
+            # ランキング画像の生成・保存（投票結果が同じ間は再描画せず、PNGのバイト列をキャッシュする）
+            @st.cache_data(ttl=None, max_entries=20)
             def generate_ranking_image(data, date_str, vote_sessions):
-                font_path = get_font_path()
-                font_prop = None
-                if font_path:
-                    from matplotlib import font_manager
-                    font_prop = font_manager.FontProperties(fname=font_path)
+                # 日本語フォントは登録してフォントファミリーとして指定し、全テキストに一括で適用する
+                font_family = get_font_family()
+                rc = {'font.family': font_family} if font_family else {}
                 
                 # 上位20位を取得
                 top_20 = data[:20]
@@ -272,45 +240,40 @@ def show(selected_date):
                         f"{percentage:.1f}%"
                     ])
                 
-                # 図の作成
-                fig_table = plt.figure(figsize=(10, len(top_20) * 0.5 + 2))
-                ax = fig_table.add_subplot(111)
-                ax.axis('off')
-                ax.set_title(f"銘柄投票ランキング ({date_str})", fontproperties=font_prop if font_path else None, fontsize=16, pad=20)
-                
-                # 表の描画
-                table = ax.table(
-                    cellText=table_data,
-                    colLabels=columns,
-                    loc='center',
-                    cellLoc='center',
-                    colWidths=[0.1, 0.15, 0.4, 0.15, 0.15]
-                )
-                
-                table.auto_set_font_size(False)
-                table.set_fontsize(12)
-                table.scale(1, 1.5)
-                
-                # フォント設定
-                if font_path:
-                    for cell in table.get_celld().values():
-                        cell.set_text_props(fontproperties=font_prop)
-                        
-                    # ヘッダーのスタイル調整
-                    for (row, col), cell in table.get_celld().items():
-                        if row == 0:
-                            cell.set_text_props(weight='bold', fontproperties=font_prop)
+                # テキストのフォントは生成時に決まるため、図の作成から保存までをrc_context内で行う
+                with rc_context(rc):
+                    # 図の作成
+                    fig_table = Figure(figsize=(10, len(top_20) * 0.5 + 2))
+                    ax = fig_table.add_subplot(111)
+                    ax.axis('off')
+                    ax.set_title(f"銘柄投票ランキング ({date_str})", fontsize=16, pad=20)
+                    
+                    # 表の描画
+                    table = ax.table(
+                        cellText=table_data,
+                        colLabels=columns,
+                        loc='center',
+                        cellLoc='center',
+                        colWidths=[0.1, 0.15, 0.4, 0.15, 0.15]
+                    )
+                    
+                    table.auto_set_font_size(False)
+                    table.set_fontsize(12)
+                    table.scale(1, 1.5)
+                    
+                    # ヘッダーのスタイル調整（ヘッダー行のセルのみ）
+                    if font_family:
+                        for col in range(len(columns)):
+                            cell = table[0, col]
+                            cell.set_text_props(weight='bold')
                             cell.set_facecolor('#f0f0f0')
 
-                return fig_table
+                    ranking_buf = BytesIO()
+                    fig_table.savefig(ranking_buf, format="png", bbox_inches='tight', pad_inches=0.1)
+                return ranking_buf.getvalue()
 
-            ranking_fig = generate_ranking_image(results, selected_date_str, vote_sessions)
-            
-            ranking_buf = BytesIO()
-            ranking_fig.savefig(ranking_buf, format="png", bbox_inches='tight', pad_inches=0.1)
+            ranking_data = generate_ranking_image(tuple(results), selected_date_str, vote_sessions)
             ranking_filename = f"銘柄投票ランキング{selected_date.strftime('%Y%m%d')}.png"
-            ranking_data = ranking_buf.getvalue()
-
             
             st.download_button(
                 label="投票結果上位20位保存",
@@ -331,25 +294,25 @@ def show(selected_date):
         )
         st.markdown("---")
         st.write("投票結果")
-        header_cols = st.columns([0.5, 1, 2, 1])
-        header_cols[0].write("No.")
-        header_cols[1].write("銘柄コード")
-        header_cols[2].write("銘柄名")
-        header_cols[3].write("投票数")
-        
-        for index, row in enumerate(results, 1):
-            stock_code, vote_count, stock_name = row
-            display_name = stock_name or stock_code  # stock_nameがNoneの場合はstock_codeを使用
-            url = f"https://jp.tradingview.com/chart/?symbol={stock_code}"
-            stock_name_link = f'<a href="{url}" target="_blank" rel="noopener noreferrer">{display_name}</a>'
-            stock_code_mark = f'<span data-stock-code="{stock_code}">{stock_code}</span>'
-
-            cols = st.columns([0.5, 1, 2, 1])
-            cols[0].write(f"{index}")
-            cols[1].markdown(stock_code_mark, unsafe_allow_html=True)
-            cols[2].markdown(stock_name_link, unsafe_allow_html=True)
-            
-            percentage = (vote_count / vote_sessions * 100) if vote_sessions > 0 else 0
-            cols[3].write(f"{vote_count} ({percentage:.1f}%)")
+        # 行ごとにウィジェットを並べず、1つの表としてまとめて描画する
+        codes = [row[0] for row in results]
+        vote_counts = [row[1] for row in results]
+        display_df = pd.DataFrame({
+            'No.': range(1, len(results) + 1),
+            '銘柄コード': codes,
+            '銘柄名': [row[2] or row[0] for row in results],  # stock_nameがNoneの場合はstock_codeを使用
+            '投票数': vote_counts,
+            '割合(%)': [(count / vote_sessions * 100) if vote_sessions > 0 else 0 for count in vote_counts],
+            'チャート': [f"https://jp.tradingview.com/chart/?symbol={code}" for code in codes]
+        })
+        st.dataframe(
+            display_df,
+            column_config={
+                "割合(%)": st.column_config.NumberColumn(format="%.1f%%"),
+                "チャート": st.column_config.LinkColumn(display_text="TradingView"),
+            },
+            hide_index=True,
+            use_container_width=True
+        )
     else:
         st.write("対象日の投票結果はまだありません。") 
\ No newline at end of file
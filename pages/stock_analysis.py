@@ -362,7 +362,7 @@ def show(selected_date):
                     # 列幅の自動調整
                     for idx, col in enumerate(df.columns):
                         max_length = max(
-                            df[col].astype(str).apply(len).max(),
+                            df[col].astype(str).str.len().max(),
                             len(str(col))
                         )
                         worksheet.column_dimensions[chr(65 + idx + 1)].width = max_length + 2  # +1 for index column
@@ -5,7 +5,7 @@ from datetime import datetime
 import csv
 from io import StringIO
 import re  # 正規表現を使用するために追加
-from utils.common import STOCKS_PER_PAGE
+from utils.common import STOCKS_PER_PAGE, clear_stock_name_cache
 
 def show(selected_date):
     st.title("銘柄マスタ管理")
@@ -164,6 +164,7 @@ def update_stock_name(stock_code, new_name):
     )
     conn.commit()
     conn.close()
+    clear_stock_name_cache()
     st.success("銘柄名を更新しました。")
 
 def save_new_stock(stock_code, stock_name):
@@ -184,6 +185,7 @@ def save_new_stock(stock_code, stock_name):
         c.execute("PRAGMA optimize;")
 
         conn.commit()
+        clear_stock_name_cache()
         st.success(f"銘柄コード {stock_code} を登録/更新しました。")
     except Exception as e:
         st.error(f"銘柄の登録/更新に失敗しました: {str(e)}")
@@ -228,6 +230,7 @@ def save_bulk_stocks(df):
 
     conn.commit()
     conn.close()
+    clear_stock_name_cache()
     
     # 結果の表示
     if success_count > 0:
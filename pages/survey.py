@@ -1,7 +1,7 @@
 import streamlit as st
 import re
 from datetime import datetime
-from utils.db import get_connection
+from utils.db import get_connection, get_survey_summary
 from utils.common import MAX_SETS, get_stock_name
 
 def show(selected_date):
@@ -75,4 +75,7 @@ def save_survey_data(selected_date_str):
     c.execute("PRAGMA optimize;")
 
     conn.commit()
-    conn.close() 
+    conn.close()
+
+    # 投票ページのアンケート集計キャッシュを破棄し、登録した銘柄をすぐに表示する
+    get_survey_summary.clear() 
@@ -1,10 +1,9 @@
 import streamlit as st
 from datetime import datetime
-from utils.db import get_connection
+from utils.db import get_connection, get_survey_summary, get_vote_summary
 from utils.common import MAX_VOTE_SELECTION, format_vote_data_with_thresh
-import csv
-from io import StringIO
 import pandas as pd
+from operator import itemgetter
 from io import BytesIO
 
 def show(selected_date):
@@ -13,38 +12,23 @@ def show(selected_date):
     st.title("銘柄投票")
     st.write(f"【対象日】{selected_date_str}")
     
-    # surveyテーブルから対象日の各銘柄のアンケート票数を集計
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute(
-        """
-        SELECT s.stock_code, COUNT(*) as survey_count, m.stock_name
-        FROM survey s
-        LEFT JOIN stock_master m ON s.stock_code = m.stock_code
-        WHERE s.survey_date = ?
-        GROUP BY s.stock_code
-        """,
-        (selected_date_str,)
-    )
-    results = c.fetchall()
-    conn.close()
+    results = get_survey_summary(selected_date_str)
     
     if results:
         # 動的な並び替え方法の選択
         sort_option = st.selectbox("並び替え方法を選択", ["銘柄コード 昇順", "アンケート票数 降順"])
         if sort_option == "銘柄コード 昇順":
-            sorted_results = sorted(results, key=lambda x: x[0])
+            sorted_results = sorted(results, key=itemgetter(0))
             sort_suffix = "_コード順"
             sorted_results_with_thresh = None
         else:
-            sorted_results = sorted(results, key=lambda x: x[1], reverse=True)
+            sorted_results = sorted(results, key=itemgetter(1), reverse=True)
             sort_suffix = "_票数順"
             sorted_results_with_thresh = format_vote_data_with_thresh(results)
         
         row1_col1, row1_col2 = st.columns(2)
         # テキストファイルExportボタン
-        codes = [row[0] for row in sorted_results]
-        file_content = "\n".join(codes)
+        file_content = "\n".join(map(itemgetter(0), sorted_results))
         filename = f"銘柄発掘{selected_date.strftime('%Y%m%d')}{sort_suffix}.txt"
         with row1_col1:
             st.download_button("銘柄コードExport", data=file_content, file_name=filename, mime="text/plain")
@@ -56,18 +40,11 @@ def show(selected_date):
         
         row2_col1, row2_col2 = st.columns(2)
         # CSVファイルExportボタン
-        csv_buffer = StringIO()
-        csv_writer = csv.writer(csv_buffer)
-        # ヘッダー行をSJISで書き込み
         headers = ['銘柄コード', 'アンケート票数', '銘柄名', 'TradingView URL']
         csv_data = [(row[0], row[1], row[2] or row[0], f'https://jp.tradingview.com/chart/?symbol={row[0]}') for row in sorted_results]
         
-        # SJISでエンコードしたバイトデータを作成
-        output = StringIO()
-        writer = csv.writer(output)
-        writer.writerow(headers)
-        writer.writerows(csv_data)
-        csv_str = output.getvalue()
+        # SJISでエンコードしたバイトデータを作成（改行はcsvモジュールと同じCRLF）
+        csv_str = pd.DataFrame(csv_data, columns=headers).to_csv(index=False, lineterminator='\r\n')
         csv_bytes = csv_str.encode('shift-jis', errors='replace')
         
         csv_filename = f"銘柄発掘{selected_date.strftime('%Y%m%d')}{sort_suffix}.csv"
@@ -97,7 +74,7 @@ def show(selected_date):
             # 列幅の自動調整
             for idx, col in enumerate(df.columns):
                 max_length = max(
-                    df[col].astype(str).apply(len).max(),
+                    df[col].astype(str).str.len().max(),
                     len(str(col))
                 )
                 worksheet.column_dimensions[chr(65 + idx)].width = max_length + 2
@@ -189,23 +166,24 @@ def save_vote_data(selected_date_str, results):
         progress_bar = st.progress(0)
         
         conn = get_connection()
-        c = conn.cursor()
-        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        for i, code in enumerate(selected_codes):
-            c.execute(
-                "INSERT INTO vote (vote_date, stock_code, created_at) VALUES (?, ?, ?)",
-                (selected_date_str, code, now)
-            )
-            # 進捗バーを更新
-            progress = (i + 1) / len(selected_codes)
-            progress_bar.progress(progress)
+        try:
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            
+            # 選択銘柄をまとめて1トランザクションで挿入（失敗時はロールバック）
+            with conn:
+                conn.executemany(
+                    "INSERT INTO vote (vote_date, stock_code, created_at) VALUES (?, ?, ?)",
+                    [(selected_date_str, code, now) for code in selected_codes]
+                )
 
-        # 統計情報の更新 (適宜)
-        c.execute("PRAGMA optimize;")
+            # 投票結果の集計キャッシュを破棄し、投票直後の結果確認・ChatWork投稿に自分の投票を反映する
+            # （投稿用の画像キャッシュは集計結果をキーにしているため、古いランキングは使われない）
+            get_vote_summary.clear()
 
-        conn.commit()
-        conn.close()
+            # 統計情報の更新 (適宜)
+            conn.execute("PRAGMA optimize;")
+        finally:
+            conn.close()
         
         # 進捗バーを完了状態に
         progress_bar.progress(1.0)
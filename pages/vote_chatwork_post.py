@@ -88,12 +88,11 @@ def show(selected_date):
         chatwork.show_login_button(return_page="vote_chatwork_post", return_date=date_str)
     else:
         try:
-            if not chatwork.is_room_member():
+            is_member, profile = chatwork.get_member_status()
+            if not is_member:
                 st.warning("このルームのメンバーではないため、投稿できません。先にChatWorkでルームに参加してください。")
                 chatwork.show_logout_button()
             else:
-                # ログインユーザー情報を取得
-                profile = chatwork.get_my_profile()
                 user_name = profile.get("name", "不明") if profile else "不明"
                 
                 col_status, col_logout = st.columns([3, 1])
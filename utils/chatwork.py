@@ -20,6 +20,7 @@ import hmac
 import secrets
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from urllib.parse import urlencode, quote
 
@@ -291,7 +292,8 @@ def clear_tokens():
     st.session_state["cw_logging_out"] = True
     
     for key in ["cw_access_token", "cw_refresh_token", "cw_expires_at", 
-                "cw_cookie_load_attempted", "cw_cookie_saved", "cw_encrypted_token"]:
+                "cw_cookie_load_attempted", "cw_cookie_saved", "cw_encrypted_token",
+                "cw_is_member", "cw_profile", "cw_member_checked_at"]:
         if key in st.session_state:
             del st.session_state[key]
     
@@ -516,6 +518,46 @@ def get_my_profile() -> dict | None:
         return None
 
 
+def get_member_status(ttl: int = 60) -> tuple[bool, dict | None]:
+    """
+    ルームメンバー判定とプロフィールをセッション単位でキャッシュして取得
+    
+    Streamlitの再実行（ボタン操作など）の度にAPIを呼ばないよう、
+    ttl秒間は session_state に保存した結果を返す。
+    
+    Returns:
+        (ルームメンバーかどうか, プロフィール辞書 or None)
+    """
+    fetched_at = st.session_state.get("cw_member_checked_at")
+    if fetched_at is None or time.time() - fetched_at > ttl:
+        is_member = is_room_member()
+        st.session_state["cw_is_member"] = is_member
+        st.session_state["cw_profile"] = get_my_profile() if is_member else None
+        st.session_state["cw_member_checked_at"] = time.time()
+    return st.session_state["cw_is_member"], st.session_state["cw_profile"]
+
+
+def _post_file(headers: dict, filename: str, data: bytes, mime: str, message: str = "") -> None:
+    """
+    1ファイルをChatWorkルームに投稿（失敗時は例外を送出）
+    
+    Args:
+        headers: 認証ヘッダー（ワーカースレッドからも使えるよう呼び出し元で作成する）
+        filename: ファイル名
+        data: ファイルのデータ
+        mime: MIMEタイプ
+        message: ファイルに付けるメッセージ（空の場合は空白1文字を送る）
+    """
+    r = requests.post(
+        f"{API_BASE}/rooms/{TARGET_ROOM_ID}/files",
+        headers=headers,
+        files={"file": (filename, data, mime)},
+        data={"message": message or " "},
+        timeout=60,
+    )
+    r.raise_for_status()
+
+
 def post_files_to_room(files_data: list[tuple[str, bytes, str]], message: str = "") -> bool:
     """
     複数ファイルをChatWorkルームに投稿
@@ -534,17 +576,53 @@ def post_files_to_room(files_data: list[tuple[str, bytes, str]], message: str =
             st.error(f"{filename}: 5MBを超えています。")
             return False
         
-        files = {"file": (filename, data, mime)}
-        form = {"message": message if i == 0 and message else " "}
-        
-        r = requests.post(
-            f"{API_BASE}/rooms/{TARGET_ROOM_ID}/files",
-            headers=_authz_header(),
-            files=files,
-            data=form,
-            timeout=60,
-        )
-        r.raise_for_status()
+        _post_file(_authz_header(), filename, data, mime, message if i == 0 else "")
+    
+    return True
+
+
+def post_files_to_room_concurrent(files_data: list[tuple[str, bytes, str]], message: str = "", max_workers: int = 3) -> bool:
+    """
+    複数ファイルをChatWorkルームに投稿（2件目以降は並列）
+    
+    メッセージを付けた最初のファイルを先に投稿し、ルームでメッセージが最初に表示されるようにする。
+    残りのファイルは独立したPOSTのため並列で送り、ネットワーク待ちを重ねて合計待ち時間を短縮する
+    （2件目以降どうしの表示順は保証されない）。
+    
+    Args:
+        files_data: [(ファイル名, データ, MIMEタイプ), ...]のリスト
+        message: 最初のファイルに付けるメッセージ
+        max_workers: 同時アップロード数（ChatWorkのレート制限を考慮して小さめに）
+    
+    Returns:
+        bool: 成功したかどうか
+    """
+    _refresh_if_needed()
+    
+    # サイズチェックは投稿前にまとめて行う（一部だけ投稿されるのを防ぐ）
+    for filename, data, mime in files_data:
+        if len(data) > 5 * 1024 * 1024:
+            st.error(f"{filename}: 5MBを超えています。")
+            return False
+    
+    if not files_data:
+        return True
+    
+    # session_state はワーカースレッドから参照できないため、ヘッダーは先に作成する
+    headers = _authz_header()
+    
+    # メッセージ付きの最初のファイルは同期で投稿する
+    first, *rest = files_data
+    _post_file(headers, *first, message)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_post_file, headers, filename, data, mime)
+            for filename, data, mime in rest
+        ]
+        # いずれかが失敗した場合は例外を呼び出し元へ伝播
+        for future in futures:
+            future.result()
     
     return True
 
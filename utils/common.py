@@ -1,4 +1,5 @@
 from datetime import datetime, date
+from functools import lru_cache
 import yfinance as yf
 from utils.db import get_connection
 
@@ -6,6 +7,20 @@ MAX_SETS = 7            # 銘柄発掘アンケートの入力セット数
 MAX_VOTE_SELECTION = 10 # 集計ページでのチェックボックスの最大選択数
 STOCKS_PER_PAGE = 100   # 銘柄マスタ一覧の1ページあたりの表示件数
 
+@lru_cache(maxsize=4096)
+def is_jpy_stock_code(stock_code):
+    """
+    銘柄コードが日本株かどうかを判定する関数（先頭文字が数値の場合は日本株）
+    同じ銘柄コードを何度も判定するため、結果をメモ化しておく。
+
+    Parameters:
+    stock_code (str): 銘柄コード
+
+    Returns:
+    bool: 日本株の場合はTrue
+    """
+    return stock_code[:1].isdigit()
+
 def get_ticker(stock_code):
     """
     銘柄コードからyfinance用のtickerを生成する関数
@@ -17,7 +32,7 @@ def get_ticker(stock_code):
     str: yfinance用のticker
     """
     # 先頭文字が数値の場合は日本株として扱う
-    if stock_code[0].isdigit():
+    if is_jpy_stock_code(stock_code):
         return f"{stock_code}.T"
     else:
         # それ以外は米国株として扱う
@@ -78,13 +93,35 @@ def format_vote_data_with_thresh(vote_data):
 
     return '\n'.join(result)
 
+@lru_cache(maxsize=4096)
+def _get_master_stock_name(stock_code):
+    """
+    stock_masterテーブルから銘柄名を取得する（見つかった銘柄名のみプロセス内でキャッシュする）
+    見つからない場合はKeyErrorを送出する。例外はキャッシュされないため、後から登録された銘柄名も取得できる。
+    """
+    conn = get_connection()
+    try:
+        result = conn.execute(
+            "SELECT stock_name FROM stock_master WHERE stock_code = ?", (stock_code,)
+        ).fetchone()
+    finally:
+        conn.close()
+    if result is None:
+        raise KeyError(stock_code)
+    return result[0]
+
+def clear_stock_name_cache():
+    """stock_masterを更新・インポートした後に、キャッシュ済みの銘柄名を破棄する"""
+    _get_master_stock_name.cache_clear()
+
 def get_stock_name(stock_code):
     """
     銘柄コードから銘柄名を取得する関数
-    1. まずstock_masterテーブルから取得を試みる
+    1. まずstock_masterテーブルから取得を試みる（結果はキャッシュする）
     2. 見つからない場合はyfinanceから取得する
     3. yfinanceから取得できた場合はstock_masterテーブルに登録する
-    4. それでも見つからない場合は銘柄コードを返す
+    4. それでも見つからない場合は銘柄コードを返す（キャッシュしないため、次回の呼び出しで再取得する）
+    stock_masterを直接更新した場合は clear_stock_name_cache() を呼ぶこと。
 
     Parameters:
     stock_code (str): 銘柄コード
@@ -93,16 +130,14 @@ def get_stock_name(stock_code):
     str: 銘柄名
     """
     # データベースから銘柄名を取得
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT stock_name FROM stock_master WHERE stock_code = ?", (stock_code,))
-    result = cursor.fetchone()
-    
-    if result:
-        conn.close()
-        return result[0]
+    try:
+        return _get_master_stock_name(stock_code)
+    except KeyError:
+        pass
 
     # yfinanceから銘柄名を取得
+    conn = get_connection()
+    cursor = conn.cursor()
     try:
         ticker = yf.Ticker(get_ticker(stock_code))
         info = ticker.info
@@ -121,4 +156,31 @@ def get_stock_name(stock_code):
     
     conn.close()
     # どちらも見つからない場合は銘柄コードを返す
-    return stock_code
\ No newline at end of file
+    return stock_code
+
+def get_stock_names(stock_codes):
+    """
+    複数の銘柄コードの銘柄名をstock_masterテーブルから1回のクエリでまとめて取得する関数
+    stock_masterにない銘柄は含めないため、必要に応じて get_stock_name で個別に取得すること。
+
+    Parameters:
+    stock_codes (list): 銘柄コードのリスト
+
+    Returns:
+    dict: {銘柄コード: 銘柄名}
+    """
+    stock_codes = list(dict.fromkeys(stock_codes))
+    if not stock_codes:
+        return {}
+
+    placeholders = ",".join("?" * len(stock_codes))
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT stock_code, stock_name FROM stock_master WHERE stock_code IN ({placeholders})",
+            stock_codes
+        )
+        return dict(cursor.fetchall())
+    finally:
+        conn.close()
\ No newline at end of file
@@ -1,5 +1,7 @@
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import streamlit as st
 
@@ -20,6 +22,50 @@ def get_connection():
     db_path = get_db_path()
     return sqlite3.connect(db_path, check_same_thread=False)
 
+def get_readonly_connection():
+    """
+    集計・参照専用の読み取り専用接続を取得
+    WALモード（init_dbで設定）と併用することで、投票の書き込みとロック競合しない。
+    行は sqlite3.Row で返すため列名でもアクセスできる。
+    参照のみのため autocommit（isolation_level=None）とし、暗黙のトランザクションを張らない。
+    """
+    db_path = get_db_path()
+    conn = sqlite3.connect(
+        f"file:{db_path}?mode=ro", uri=True, check_same_thread=False, isolation_level=None
+    )
+    conn.row_factory = sqlite3.Row
+    return conn
+
+# 共有接続は複数スレッドから使われるため、利用中はロックで直列化する
+_shared_connection_lock = threading.Lock()
+
+@st.cache_resource
+def _get_shared_connection():
+    """
+    プロセス内で共有するSQLite接続を取得
+    株価キャッシュの参照など、呼び出し回数の多い処理で接続・切断を繰り返さないために使う。
+    """
+    conn = get_connection()
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA cache_size=-64000;")  # 約64MB
+    conn.execute("PRAGMA temp_store=MEMORY;")  # IN句・ソート用の一時領域をメモリに置く
+    return conn
+
+@contextmanager
+def shared_connection():
+    """
+    共有SQLite接続を排他的に借りる
+    withブロックの中でのみ使用し、close()はしないこと。例外時は未確定の変更をロールバックする。
+    """
+    with _shared_connection_lock:
+        conn = _get_shared_connection()
+        try:
+            yield conn
+        except Exception:
+            conn.rollback()
+            raise
+
 @st.cache_resource(ttl=24*3600)  # 24時間（1日）でキャッシュを無効化
 def init_db():
     """
@@ -58,6 +104,8 @@ def init_db():
         """
     )
     c.execute("CREATE INDEX IF NOT EXISTS idx_vote_date_stock_code ON vote (vote_date, stock_code);")
+    # 投票セッション数（COUNT DISTINCT created_at）と銘柄別集計をカバリングインデックスで処理
+    c.execute("CREATE INDEX IF NOT EXISTS idx_vote_date_created_stock ON vote (vote_date, created_at, stock_code);")
 
     # 銘柄マスタテーブルを追加
     c.execute(
@@ -109,6 +157,8 @@ def init_price_cache_table():
     conn = get_connection()
     try:
         cursor = conn.cursor()
+        # (stock_code, date) の主キーで1件ずつ引くため、WITHOUT ROWIDで主キー順に格納し
+        # 主キー索引からの行の再参照を不要にする（既存のテーブルはそのまま主キー索引で引く）
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS price_cache (
                 stock_code TEXT NOT NULL,
@@ -117,9 +167,18 @@ def init_price_cache_table():
                 currency TEXT NOT NULL,
                 updated_at TEXT NOT NULL,
                 PRIMARY KEY (stock_code, date)
-            )
+            ) WITHOUT ROWID
         """)
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_price_cache_updated_at ON price_cache (updated_at);")
+        # 株価が取得できなかった（銘柄・日付）を記録し、再実行時の無駄なダウンロードを防ぐ
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS price_cache_miss (
+                stock_code TEXT NOT NULL,
+                date TEXT NOT NULL,
+                checked_at TEXT NOT NULL,
+                PRIMARY KEY (stock_code, date)
+            ) WITHOUT ROWID
+        """)
         conn.commit()
     finally:
         conn.close()
@@ -138,5 +197,67 @@ def get_vote_results_top_n(vote_date, top_n=20):
             LIMIT ?
         """, (vote_date, top_n))
         return cursor.fetchall()  # [(銘柄コード, 投票数), ...]
+    finally:
+        conn.close()
+
+@st.cache_data(ttl=60)  # ボタン操作による再実行時はDBを再集計しない
+def get_vote_summary(vote_date):
+    """
+    指定日の銘柄別の投票数（多い順）と、投票数の合計・投票ボタンが押された回数を取得
+    投票結果確認ページとChatWork投稿ページで共有し、投票を登録したら get_vote_summary.clear() で破棄する
+
+    Returns:
+    tuple: ([(銘柄コード, 投票数, 銘柄名), ...], 投票数の合計, 投票ボタンが押された回数)
+    """
+    # autocommitの読み取り専用接続で、集計クエリ1回のみを実行する
+    conn = get_readonly_connection()
+    try:
+        # 各銘柄の投票数と投票ボタンが押された回数（created_atが同じものを1回としてカウント）を1回のクエリで集計
+        rows = conn.execute(
+            """
+            SELECT v.stock_code, COUNT(*) as vote_count, m.stock_name,
+                   (SELECT COUNT(DISTINCT created_at) FROM vote WHERE vote_date = ?) as vote_sessions
+            FROM vote v
+            LEFT JOIN stock_master m ON v.stock_code = m.stock_code
+            WHERE v.vote_date = ?
+            GROUP BY v.stock_code
+            ORDER BY vote_count DESC
+            """,
+            (vote_date, vote_date)
+        ).fetchall()
+    finally:
+        conn.close()
+
+    # 投票ボタンが押された回数は全行共通なので先頭行から取り出す
+    vote_sessions = rows[0]["vote_sessions"] if rows else 0
+    # キャッシュ（pickle）できるよう sqlite3.Row から通常のタプルに変換
+    results = [tuple(row)[:3] for row in rows]
+    total_votes = sum(row[1] for row in results)
+
+    return results, total_votes, vote_sessions
+
+@st.cache_data(ttl=60)  # 並び替えや銘柄選択による再実行時はDBを再集計しない
+def get_survey_summary(survey_date):
+    """
+    surveyテーブルから指定日の各銘柄のアンケート票数を集計
+    アンケートを登録したら get_survey_summary.clear() で破棄する
+
+    Returns:
+    list: [(銘柄コード, 票数, 銘柄名), ...]
+    """
+    conn = get_connection()
+    try:
+        c = conn.cursor()
+        c.execute(
+            """
+            SELECT s.stock_code, COUNT(*) as survey_count, m.stock_name
+            FROM survey s
+            LEFT JOIN stock_master m ON s.stock_code = m.stock_code
+            WHERE s.survey_date = ?
+            GROUP BY s.stock_code
+            """,
+            (survey_date,)
+        )
+        return c.fetchall()
     finally:
         conn.close()
\ No newline at end of file